@@ -7,7 +7,12 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont
 import os
+from functools import partial
 from app import database as db
+from app.async_db import get_async_db
+from app.tracing import traced
+from app.badge_key import normalize_badge_id
+from app.batch_dialog import BatchDialog
 
 class AdminWindow(QMainWindow):
     badge_selected = pyqtSignal(str)
@@ -15,6 +20,8 @@ class AdminWindow(QMainWindow):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.selected_badge_id = None
+        self.loaded_credits = None
+        self.async_db = get_async_db()
         self.setup_ui()
         self.refresh_character_list()
         
@@ -90,6 +97,11 @@ class AdminWindow(QMainWindow):
         btn_layout.addWidget(show_btn)
         
         left_layout.addLayout(btn_layout)
+        
+        batch_btn = QPushButton("Actions groupées")
+        batch_btn.clicked.connect(self.open_batch_dialog)
+        left_layout.addWidget(batch_btn)
+        
         main_layout.addWidget(left_frame, 1)
         
         right_frame = QFrame()
@@ -150,7 +162,7 @@ class AdminWindow(QMainWindow):
         credits_layout = QHBoxLayout()
         credits_label = QLabel("Crédits:")
         self.credits_spin = QSpinBox()
-        self.credits_spin.setRange(0, 100000)
+        self.credits_spin.setRange(*db.CREDIT_RANGE)
         self.credits_spin.setValue(100)
         credits_layout.addWidget(credits_label)
         credits_layout.addWidget(self.credits_spin)
@@ -160,7 +172,7 @@ class AdminWindow(QMainWindow):
         situation_layout = QHBoxLayout()
         situation_label = QLabel("Situation:")
         self.situation_combo = QComboBox()
-        self.situation_combo.addItems(["recherche", "en_fuite", "RAS", "endette", "malfrat"])
+        self.situation_combo.addItems(db.SITUATIONS)
         self.situation_combo.setCurrentText("RAS")
         situation_layout.addWidget(situation_label)
         situation_layout.addWidget(self.situation_combo)
@@ -176,13 +188,18 @@ class AdminWindow(QMainWindow):
         
         main_layout.addWidget(right_frame, 1)
         
+    @traced("ui")
     def refresh_character_list(self):
-        self.character_list.clear()
-        characters = db.get_all_characters()
+        self.async_db.submit("admin.list", db.get_all_characters,
+                             callback=self.populate_character_list,
+                             errback=self.show_error)
         
+    @traced("ui")
+    def populate_character_list(self, characters):
+        self.character_list.clear()
         for char in characters:
-            badge_id = char[1]
-            nom_perso = char[5] or "Sans nom"
+            badge_id = char.badge_id
+            nom_perso = char.nom_perso or "Sans nom"
             item = QListWidgetItem(f"{nom_perso} ({badge_id})")
             item.setData(Qt.UserRole, badge_id)
             self.character_list.addItem(item)
@@ -191,33 +208,34 @@ class AdminWindow(QMainWindow):
         badge_id = item.data(Qt.UserRole)
         self.select_character(badge_id)
         
+    @traced("ui")
     def select_character(self, badge_id):
         self.selected_badge_id = badge_id
-        char = db.get_character_by_badge(badge_id)
+        self.async_db.submit("admin.select", db.get_character_by_badge, badge_id,
+                             callback=self.fill_form, errback=self.show_error)
         
+    @traced("ui")
+    def fill_form(self, char):
         if char:
-            self.badge_id_edit.setText(char[1])
-            self.file_path_edit.setText(char[4] or "")
-            self.nom_perso_edit.setText(char[5] or "")
-            
-            stat_mapping = {
-                'vigueur': char[6],
-                'agilite': char[7],
-                'intelligence': char[8],
-                'ruse': char[9],
-                'volonte': char[10],
-                'presence': char[11]
-            }
+            self.badge_id_edit.setText(char.badge_id)
+            self.file_path_edit.setText(char.file_path or "")
+            self.nom_perso_edit.setText(char.nom_perso or "")
             
-            for key, value in stat_mapping.items():
+            for key in db.STAT_FIELDS:
                 if key in self.stat_spins:
-                    self.stat_spins[key].setValue(value or 5)
+                    self.stat_spins[key].setValue(getattr(char, key) or 5)
                     
-            self.credits_spin.setValue(char[17] or 100)
-            self.situation_combo.setCurrentText(db.get_situation_from_row(char))
+            # Saving sends the difference from the value shown, not the
+            # value: untouched, the spinbox changes nothing, even when it
+            # had to clamp a balance outside CREDIT_RANGE.
+            self.credits_spin.setValue(char.credits or 0)
+            self.loaded_credits = self.credits_spin.value()
+            self.situation_combo.setCurrentText(char.situation)
             
     def new_character(self):
+        self.async_db.cancel("admin.select")
         self.selected_badge_id = None
+        self.loaded_credits = None
         self.badge_id_edit.clear()
         self.nom_perso_edit.clear()
         self.file_path_edit.clear()
@@ -235,7 +253,8 @@ class AdminWindow(QMainWindow):
             self.file_path_edit.setText(os.path.basename(filename))
             
     def save_character(self):
-        badge_id = self.badge_id_edit.text().strip()
+        badge_id = normalize_badge_id(self.badge_id_edit.text())
+        self.badge_id_edit.setText(badge_id)
         nom_perso = self.nom_perso_edit.text().strip()
         file_path = self.file_path_edit.text().strip()
         
@@ -253,22 +272,42 @@ class AdminWindow(QMainWindow):
         credits = self.credits_spin.value()
         situation = self.situation_combo.currentText()
         
-        existing = db.get_character_by_badge(badge_id)
-        
-        try:
-            if existing:
-                db.update_character(badge_id, file_path, nom_perso, vigueur, agilite,
-                                   intelligence, ruse, volonte, presence, credits, situation)
-                QMessageBox.information(self, "Succès", "Personnage mis à jour.")
-            else:
-                db.add_character(badge_id, file_path, nom_perso, vigueur, agilite,
-                                intelligence, ruse, volonte, presence, credits, situation)
-                QMessageBox.information(self, "Succès", "Personnage ajouté.")
-                
-            self.selected_badge_id = badge_id
-            self.refresh_character_list()
-        except Exception as e:
-            QMessageBox.critical(self, "Erreur", f"Erreur: {str(e)}")
+        values = (file_path, nom_perso, vigueur, agilite, intelligence, ruse, volonte,
+                  presence, credits, situation)
+        self.async_db.submit("admin.save", db.get_character_by_badge, badge_id,
+                             callback=partial(self.write_character, badge_id, values),
+                             errback=self.show_error)
+        
+    @traced("ui")
+    def write_character(self, badge_id, values, existing):
+        if existing:
+            # Credits go through as a delta against the balance shown in the
+            # form, so changes made from another station are kept.
+            credits = values[8]
+            delta = 0
+            if self.loaded_credits is not None and badge_id == self.selected_badge_id:
+                delta = credits - self.loaded_credits
+            elif credits != (existing.credits or 0):
+                delta = credits - (existing.credits or 0)
+            future = db.update_character(badge_id, *values[:8], None, values[9],
+                                         credits_delta=delta)
+            self.loaded_credits = credits
+            message = "Personnage mis à jour."
+        else:
+            future = db.add_character(badge_id, *values)
+            message = "Personnage ajouté."
+        self.async_db.watch(future, partial(self.on_character_saved, badge_id, message),
+                            self.show_error)
+        
+    @traced("ui")
+    def on_character_saved(self, badge_id, message, _):
+        QMessageBox.information(self, "Succès", message)
+        self.refresh_character_list()
+        # Reloads the balance, which may include changes from elsewhere.
+        self.select_character(badge_id)
+        
+    def show_error(self, error):
+        QMessageBox.critical(self, "Erreur", f"Erreur: {str(error)}")
             
     def delete_character(self):
         if not self.selected_badge_id:
@@ -280,9 +319,16 @@ class AdminWindow(QMainWindow):
                                      "Êtes-vous sûr de vouloir supprimer ce personnage?",
                                      QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            db.delete_character(self.selected_badge_id)
+            future = db.delete_character(self.selected_badge_id)
             self.new_character()
-            self.refresh_character_list()
+            self.async_db.watch(future, lambda _: self.refresh_character_list(), self.show_error)
+            
+    def open_batch_dialog(self):
+        dialog = BatchDialog(self)
+        dialog.applied.connect(lambda _: self.refresh_character_list())
+        dialog.exec_()
+        if self.selected_badge_id:
+            self.select_character(self.selected_badge_id)
             
     def show_in_user_view(self):
         if self.selected_badge_id:
@@ -0,0 +1,158 @@
+import itertools
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+MAX_THREADS = 2
+
+
+class _Signals(QObject):
+    finished = pyqtSignal(str, int, object)
+    failed = pyqtSignal(str, int, object)
+    future_done = pyqtSignal(int, object)
+
+
+class _QueryTask(QRunnable):
+    def __init__(self, signals, channel, ticket, fn, args):
+        super().__init__()
+        # Ownership stays on the Python side so a queued task can be taken
+        # back with tryTake() and simply dropped.
+        self.setAutoDelete(False)
+        self.signals = signals
+        self.channel = channel
+        self.ticket = ticket
+        self.fn = fn
+        self.args = args
+
+    def run(self):
+        try:
+            result = self.fn(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(self.channel, self.ticket, e)
+        else:
+            self.signals.finished.emit(self.channel, self.ticket, result)
+
+
+class AsyncDatabase(QObject):
+    # Runs database calls on a QThreadPool and delivers results on the GUI
+    # thread. Requests are grouped by channel: a new request on a channel
+    # supersedes the previous one, which is taken back from the pool if it
+    # has not started yet, or has its result dropped if it has. Three quick
+    # scans therefore update the view once, with the last badge.
+
+    def __init__(self, parent=None, max_threads=MAX_THREADS):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        # Pool threads keep their SQLite connection (see ConnectionManager),
+        # so they must not expire and take it with them.
+        self.pool.setExpiryTimeout(-1)
+        self.cancelled = 0
+        self.dropped = 0
+        self.delivered = 0
+        self._signals = _Signals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+        self._signals.future_done.connect(self._on_future_done)
+        self._tickets = itertools.count(1)
+        self._latest = {}
+        self._pending = {}
+        self._watched = {}
+
+    def submit(self, channel, fn, *args, callback=None, errback=None):
+        self.cancel(channel)
+        ticket = next(self._tickets)
+        task = _QueryTask(self._signals, channel, ticket, fn, args)
+        self._latest[channel] = ticket
+        self._pending[ticket] = (task, callback, errback)
+        self.pool.start(task)
+        return ticket
+
+    def cancel(self, channel):
+        ticket = self._latest.pop(channel, None)
+        if ticket is None or ticket not in self._pending:
+            return
+        task = self._pending[ticket][0]
+        if self.pool.tryTake(task):
+            del self._pending[ticket]
+            self.cancelled += 1
+
+    def watch(self, future, callback=None, errback=None):
+        # Bridge a concurrent.futures.Future (e.g. from the database writer)
+        # back to the GUI thread.
+        token = next(self._tickets)
+        self._watched[token] = (callback, errback)
+        future.add_done_callback(lambda f: self._signals.future_done.emit(token, f))
+        return token
+
+    def stats(self):
+        return {
+            'delivered': self.delivered,
+            'cancelled': self.cancelled,
+            'dropped': self.dropped,
+            'pending': len(self._pending),
+            'active_threads': self.pool.activeThreadCount(),
+        }
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+        self._pending.clear()
+        self._latest.clear()
+
+    def _take(self, channel, ticket):
+        entry = self._pending.pop(ticket, None)
+        if entry is None:
+            return None
+        if self._latest.get(channel) != ticket:
+            self.dropped += 1
+            return None
+        del self._latest[channel]
+        return entry
+
+    @pyqtSlot(str, int, object)
+    def _on_finished(self, channel, ticket, result):
+        entry = self._take(channel, ticket)
+        if entry is None:
+            return
+        self.delivered += 1
+        callback = entry[1]
+        if callback is not None:
+            callback(result)
+
+    @pyqtSlot(str, int, object)
+    def _on_failed(self, channel, ticket, error):
+        entry = self._take(channel, ticket)
+        if entry is None:
+            return
+        errback = entry[2]
+        if errback is not None:
+            errback(error)
+        else:
+            raise error
+
+    @pyqtSlot(int, object)
+    def _on_future_done(self, token, future):
+        callback, errback = self._watched.pop(token, (None, None))
+        error = future.exception()
+        if error is not None:
+            if errback is not None:
+                errback(error)
+            else:
+                raise error
+        elif callback is not None:
+            callback(future.result())
+
+
+_instance = None
+
+def get_async_db():
+    # Shared instance, created lazily on the GUI thread.
+    global _instance
+    if _instance is None:
+        _instance = AsyncDatabase()
+    return _instance
+
+def shutdown_async_db():
+    global _instance
+    if _instance is not None:
+        _instance.shutdown()
+        _instance = None
@@ -0,0 +1,65 @@
+import re
+
+# Canonical badge identifiers.
+#
+# A card UID is written as lowercase, zero-padded hex bytes joined by ':'
+# ("0a:1b:2c:3d"), whatever form it arrived in: the original sketch drops
+# leading zeros ("a:1b:2c:3d"), people type "0A-1B-2C-3D" or "0a 1b 2c 3d".
+# Anything that is not a separated UID (BADGE001, test labels) is kept as
+# typed, minus surrounding whitespace.
+#
+# The lookup key stored in rfid_log.badge_key is derived from that:
+#   - UIDs of up to 7 bytes (all single and double size MIFARE cards) pack
+#     into one 64-bit integer, with the length in the top byte so that
+#     00:00:00:01 and 00:00:00:00:00:00:01 stay distinct;
+#   - longer (10-byte) UIDs are kept as a blob of the raw bytes;
+#   - labels are kept as text.
+
+UID_SEPARATORS = re.compile(r'[:\- ]+')
+UID_GROUP = re.compile(r'[0-9A-Fa-f]{1,2}')
+MIN_UID_BYTES = 4
+MAX_UID_BYTES = 10
+MAX_PACKED_BYTES = 7
+
+
+def parse_uid(value):
+    # Returns the UID bytes of a separated hex UID, or None for a label.
+    text = str(value).strip()
+    # Fast path for the padded "0a:1b:2c:3d" form the hub produces.
+    count = len(text) // 3 + 1
+    if len(text) == count * 3 - 1 and text[2::3] == ':' * (count - 1):
+        try:
+            uid = bytes.fromhex(text.replace(':', ''))
+        except ValueError:
+            uid = None
+        if uid is not None and len(uid) == count and MIN_UID_BYTES <= count <= MAX_UID_BYTES:
+            return uid
+    groups = UID_SEPARATORS.split(text)
+    if not MIN_UID_BYTES <= len(groups) <= MAX_UID_BYTES:
+        return None
+    if not all(UID_GROUP.fullmatch(group) for group in groups):
+        return None
+    return bytes(int(group, 16) for group in groups)
+
+
+def format_uid(uid):
+    return bytes(uid).hex(':')
+
+
+def normalize_badge_id(value):
+    text = str(value).strip()
+    uid = parse_uid(text)
+    return format_uid(uid) if uid is not None else text
+
+
+def uid_key(uid):
+    if len(uid) <= MAX_PACKED_BYTES:
+        return (len(uid) << 56) | int.from_bytes(uid, 'big')
+    return bytes(uid)
+
+
+def badge_key(value):
+    uid = parse_uid(value)
+    if uid is None:
+        return str(value).strip()
+    return uid_key(uid)
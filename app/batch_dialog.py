@@ -0,0 +1,233 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel, QPushButton,
+    QLineEdit, QComboBox, QCheckBox, QSpinBox, QDoubleSpinBox, QGroupBox,
+    QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox, QStackedWidget, QWidget
+)
+from PyQt5.QtCore import pyqtSignal
+from functools import partial
+from PyQt5.QtGui import QFont
+from app import database as db
+from app import batch_ops
+from app.async_db import get_async_db
+
+STAT_LABELS = (
+    ("vigueur", "Vigueur"), ("agilite", "Agilité"), ("intelligence", "Intelligence"),
+    ("ruse", "Ruse"), ("volonte", "Volonté"), ("presence", "Présence")
+)
+
+ACTIONS = (
+    "Changer la situation",
+    "Ajuster les crédits (%)",
+    "Ajuster les crédits (montant)",
+    "Ajuster une statistique",
+)
+
+
+class BatchDialog(QDialog):
+    applied = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.async_db = get_async_db()
+        # Bumped on every settings change and preview request, so a preview
+        # computed for older settings never enables Apply.
+        self.preview_generation = 0
+        self.setup_ui()
+
+    def setup_ui(self):
+        self.setWindowTitle("Actions groupées")
+        self.resize(720, 640)
+        layout = QVBoxLayout(self)
+
+        filter_box = QGroupBox("Personnages concernés")
+        filter_layout = QVBoxLayout(filter_box)
+
+        situation_layout = QHBoxLayout()
+        situation_layout.addWidget(QLabel("Situation:"))
+        self.situation_checks = {}
+        for situation in db.SITUATIONS:
+            check = QCheckBox(db.get_situation_display(situation))
+            self.situation_checks[situation] = check
+            situation_layout.addWidget(check)
+        situation_layout.addStretch()
+        filter_layout.addLayout(situation_layout)
+
+        stats_grid = QGridLayout()
+        low, high = db.STAT_RANGE
+        self.stat_filters = {}
+        for index, (field, label) in enumerate(STAT_LABELS):
+            check = QCheckBox(label)
+            min_spin = QSpinBox()
+            min_spin.setRange(low, high)
+            min_spin.setValue(low)
+            max_spin = QSpinBox()
+            max_spin.setRange(low, high)
+            max_spin.setValue(high)
+            row, col = index // 2, (index % 2) * 4
+            stats_grid.addWidget(check, row, col)
+            stats_grid.addWidget(min_spin, row, col + 1)
+            stats_grid.addWidget(QLabel("à"), row, col + 2)
+            stats_grid.addWidget(max_spin, row, col + 3)
+            self.stat_filters[field] = (check, min_spin, max_spin)
+        filter_layout.addLayout(stats_grid)
+
+        name_layout = QHBoxLayout()
+        name_layout.addWidget(QLabel("Nom:"))
+        self.name_edit = QLineEdit()
+        self.name_edit.setPlaceholderText("Motif, ex: Mar* (vide = tous)")
+        name_layout.addWidget(self.name_edit)
+        filter_layout.addLayout(name_layout)
+
+        layout.addWidget(filter_box)
+
+        action_box = QGroupBox("Action")
+        action_layout = QHBoxLayout(action_box)
+        self.action_combo = QComboBox()
+        self.action_combo.addItems(ACTIONS)
+        action_layout.addWidget(self.action_combo)
+
+        self.action_params = QStackedWidget()
+        self.situation_combo = QComboBox()
+        self.situation_combo.addItems(db.SITUATIONS)
+        self.action_params.addWidget(self.situation_combo)
+
+        self.percent_spin = QDoubleSpinBox()
+        self.percent_spin.setRange(-100, 1000)
+        self.percent_spin.setSuffix(" %")
+        self.percent_spin.setValue(-10)
+        self.action_params.addWidget(self.percent_spin)
+
+        self.amount_spin = QSpinBox()
+        self.amount_spin.setRange(-100000, 100000)
+        self.amount_spin.setValue(100)
+        self.action_params.addWidget(self.amount_spin)
+
+        stat_widget = QWidget()
+        stat_layout = QHBoxLayout(stat_widget)
+        stat_layout.setContentsMargins(0, 0, 0, 0)
+        self.stat_combo = QComboBox()
+        for field, label in STAT_LABELS:
+            self.stat_combo.addItem(label, field)
+        self.stat_delta_spin = QSpinBox()
+        self.stat_delta_spin.setRange(-(high - low), high - low)
+        self.stat_delta_spin.setValue(1)
+        stat_layout.addWidget(self.stat_combo)
+        stat_layout.addWidget(self.stat_delta_spin)
+        self.action_params.addWidget(stat_widget)
+
+        self.action_combo.currentIndexChanged.connect(self.action_params.setCurrentIndex)
+        action_layout.addWidget(self.action_params, 1)
+
+        self.reason_edit = QLineEdit()
+        self.reason_edit.setPlaceholderText("Motif (journal des crédits)")
+        action_layout.addWidget(self.reason_edit)
+        layout.addWidget(action_box)
+
+        self.summary_label = QLabel("Cliquez sur Aperçu pour voir les personnages concernés.")
+        self.summary_label.setFont(QFont("Arial", 11, QFont.Bold))
+        layout.addWidget(self.summary_label)
+
+        self.preview_table = QTableWidget(0, 4)
+        self.preview_table.setHorizontalHeaderLabels(["Badge", "Nom", "Avant", "Après"])
+        self.preview_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.preview_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.preview_table, 1)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        preview_btn = QPushButton("Aperçu")
+        preview_btn.clicked.connect(self.refresh_preview)
+        buttons.addWidget(preview_btn)
+        self.apply_btn = QPushButton("Appliquer")
+        self.apply_btn.setObjectName("save")
+        self.apply_btn.setEnabled(False)
+        self.apply_btn.clicked.connect(self.apply_batch)
+        buttons.addWidget(self.apply_btn)
+        close_btn = QPushButton("Fermer")
+        close_btn.clicked.connect(self.reject)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+        for check in self.situation_checks.values():
+            check.toggled.connect(self.invalidate_preview)
+        for check, min_spin, max_spin in self.stat_filters.values():
+            check.toggled.connect(self.invalidate_preview)
+            min_spin.valueChanged.connect(self.invalidate_preview)
+            max_spin.valueChanged.connect(self.invalidate_preview)
+        self.name_edit.textChanged.connect(self.invalidate_preview)
+        self.action_combo.currentIndexChanged.connect(self.invalidate_preview)
+        for spin in (self.percent_spin, self.amount_spin, self.stat_delta_spin):
+            spin.valueChanged.connect(self.invalidate_preview)
+        self.situation_combo.currentIndexChanged.connect(self.invalidate_preview)
+        self.stat_combo.currentIndexChanged.connect(self.invalidate_preview)
+
+    def build_filter(self):
+        situations = [s for s, check in self.situation_checks.items() if check.isChecked()]
+        stat_ranges = {
+            field: (min_spin.value(), max_spin.value())
+            for field, (check, min_spin, max_spin) in self.stat_filters.items()
+            if check.isChecked()
+        }
+        return batch_ops.RosterFilter(situations=situations, stat_ranges=stat_ranges,
+                                      name_pattern=self.name_edit.text())
+
+    def build_action(self):
+        index = self.action_combo.currentIndex()
+        if index == 0:
+            return batch_ops.SetSituation(self.situation_combo.currentText())
+        if index == 1:
+            return batch_ops.AdjustCredits(percent=self.percent_spin.value())
+        if index == 2:
+            return batch_ops.AdjustCredits(amount=self.amount_spin.value())
+        return batch_ops.AdjustStat(self.stat_combo.currentData(), self.stat_delta_spin.value())
+
+    def invalidate_preview(self, *_):
+        self.preview_generation += 1
+        self.summary_label.setText("Paramètres modifiés, cliquez sur Aperçu.")
+        self.apply_btn.setEnabled(False)
+
+    def refresh_preview(self):
+        roster_filter = self.build_filter()
+        action = self.build_action()
+        self.preview_generation += 1
+        self.apply_btn.setEnabled(False)
+        self.summary_label.setText("Calcul de l'aperçu...")
+        self.async_db.submit("batch.preview", batch_ops.preview, roster_filter, action,
+                             callback=partial(self.show_preview, self.preview_generation,
+                                              action.column),
+                             errback=self.show_error)
+
+    def show_preview(self, generation, column, result):
+        if generation != self.preview_generation:
+            # Settings changed while the query ran; this preview no longer
+            # describes what Apply would do.
+            return
+        total, rows = result
+        self.preview_table.setRowCount(len(rows))
+        for i, (char, new_value) in enumerate(rows):
+            old_value = getattr(char, column)
+            for col, value in enumerate((char.badge_id, char.nom_perso or "Sans nom",
+                                         old_value, new_value)):
+                self.preview_table.setItem(i, col, QTableWidgetItem(str(value)))
+        shown = f" ({len(rows)} affichés)" if len(rows) < total else ""
+        self.summary_label.setText(f"{total} personnage(s) seront modifiés{shown}.")
+        self.apply_btn.setEnabled(total > 0)
+
+    def apply_batch(self):
+        action = self.build_action()
+        reply = QMessageBox.question(self, "Confirmation",
+                                     f"Appliquer « {action.describe()} » aux personnages sélectionnés ?",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        self.apply_btn.setEnabled(False)
+        future = batch_ops.apply(self.build_filter(), action, self.reason_edit.text().strip())
+        self.async_db.watch(future, self.on_applied, self.show_error)
+
+    def on_applied(self, count):
+        self.summary_label.setText(f"{count} personnage(s) modifiés.")
+        self.preview_table.setRowCount(0)
+        self.applied.emit(count)
+
+    def show_error(self, error):
+        QMessageBox.critical(self, "Erreur", f"Erreur: {str(error)}")
@@ -0,0 +1,139 @@
+import time
+from app import database as db
+from app.badge_key import badge_key
+
+PREVIEW_LIMIT = 200
+
+
+class RosterFilter:
+    # Selects characters by situation, stat ranges, name pattern and/or an
+    # explicit badge list. Criteria are ANDed; an empty filter matches the
+    # whole roster. Name patterns use * and ? wildcards, case-insensitive.
+
+    def __init__(self, situations=None, stat_ranges=None, name_pattern=None, badge_ids=None):
+        self.situations = tuple(situations or ())
+        self.stat_ranges = dict(stat_ranges or {})
+        self.name_pattern = (name_pattern or "").strip()
+        self.badge_ids = tuple(badge_ids or ())
+
+    def compile(self):
+        clauses = []
+        params = []
+        if self.situations:
+            for situation in self.situations:
+                if situation not in db.SITUATIONS:
+                    raise ValueError(f"Situation inconnue: {situation!r}")
+            clauses.append(f"situation IN ({', '.join('?' for _ in self.situations)})")
+            params.extend(self.situations)
+        for stat, (low, high) in self.stat_ranges.items():
+            _check_stat(stat)
+            clauses.append(f"{stat} BETWEEN ? AND ?")
+            params.extend((low, high))
+        if self.name_pattern:
+            pattern = (self.name_pattern.replace("\\", "\\\\").replace("%", "\\%")
+                       .replace("_", "\\_").replace("*", "%").replace("?", "_"))
+            clauses.append("nom_perso LIKE ? ESCAPE '\\'")
+            params.append(pattern)
+        if self.badge_ids:
+            clauses.append(f"badge_key IN ({', '.join('?' for _ in self.badge_ids)})")
+            params.extend(badge_key(badge_id) for badge_id in self.badge_ids)
+        return " AND ".join(clauses) or "1", params
+
+
+class SetSituation:
+    column = "situation"
+
+    def __init__(self, situation):
+        if situation not in db.SITUATIONS:
+            raise ValueError(f"Situation inconnue: {situation!r}")
+        self.situation = situation
+
+    def compile(self):
+        return "?", [self.situation]
+
+    def describe(self):
+        return f"situation → {db.get_situation_display(self.situation)}"
+
+
+class AdjustCredits:
+    # credits + amount, then scaled by percent (-10 = lose 10%), rounded.
+    column = "credits"
+
+    def __init__(self, amount=0, percent=0):
+        self.amount = int(amount)
+        self.percent = float(percent)
+
+    def compile(self):
+        return ("CAST(ROUND((COALESCE(credits, 0) + ?) * (1 + ? / 100.0)) AS INTEGER)",
+                [self.amount, self.percent])
+
+    def describe(self):
+        parts = []
+        if self.amount:
+            parts.append(f"{self.amount:+d} crédits")
+        if self.percent:
+            parts.append(f"{self.percent:+g} %")
+        return ", ".join(parts) or "crédits inchangés"
+
+
+class AdjustStat:
+    # stat + delta, clamped to the admin form's range.
+    def __init__(self, stat, delta):
+        _check_stat(stat)
+        self.column = stat
+        self.delta = int(delta)
+
+    def compile(self):
+        low, high = db.STAT_RANGE
+        return f"MIN(MAX(COALESCE({self.column}, 5) + ?, {low}), {high})", [self.delta]
+
+    def describe(self):
+        return f"{self.column} {self.delta:+d}"
+
+
+def _check_stat(stat):
+    if stat not in db.STAT_FIELDS:
+        raise ValueError(f"Statistique inconnue: {stat!r}")
+
+
+def preview(roster_filter, action, limit=PREVIEW_LIMIT):
+    # Returns (total, rows) where rows are (Character, new value) for the
+    # first `limit` characters the batch would change, computed by the same
+    # SQL expression apply() uses.
+    where, where_params = roster_filter.compile()
+    expression, expr_params = action.compile()
+    conn = db.get_connection()
+    total = conn.execute(f'''
+        SELECT COUNT(*) FROM rfid_log
+        WHERE {where} AND {action.column} IS NOT ({expression})
+    ''', where_params + expr_params).fetchone()[0]
+    rows = conn.execute(f'''
+        SELECT {db.CHARACTER_COLUMNS}, {expression} FROM rfid_log
+        WHERE {where} AND {action.column} IS NOT ({expression})
+        ORDER BY nom_perso
+        LIMIT ?
+    ''', expr_params + where_params + expr_params + [limit]).fetchall()
+    return total, [(db.Character(row[:-1]), row[-1]) for row in rows]
+
+def apply(roster_filter, action, reason=""):
+    # One UPDATE on the writer thread, in its own transaction; credit
+    # changes are written to the ledger by a matching set-based INSERT.
+    # Resolves to the number of characters changed.
+    where, where_params = roster_filter.compile()
+    expression, expr_params = action.compile()
+    return db.submit_write(_apply, action.column, where, where_params, expression,
+                           expr_params, reason or action.describe(),
+                           on_commit=db.clear_badge_cache, exclusive=True)
+
+def _apply(conn, column, where, where_params, expression, expr_params, reason):
+    changed = f"{where} AND {column} IS NOT ({expression})"
+    if column == "credits":
+        conn.execute(f'''
+            INSERT INTO credit_ledger (badge_id, delta, balance, reason, created_at)
+            SELECT badge_id, ({expression}) - COALESCE(credits, 0), {expression}, ?, ?
+            FROM rfid_log WHERE {changed}
+        ''', expr_params + expr_params + [reason, time.time()] + where_params + expr_params)
+    cursor = conn.execute(f'''
+        UPDATE rfid_log SET {column} = {expression} WHERE {changed}
+    ''', expr_params + where_params + expr_params)
+    return cursor.rowcount
@@ -1,15 +1,286 @@
 import sqlite3
 import os
+import csv
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from functools import partial
+from app.badge_key import badge_key, normalize_badge_id
+from app.db_writer import DatabaseWriter
+from app.tracing import span, traced
 
 DB_PATH = 'rfid_data.db'
 
+# sqlite3 keeps compiled statements per connection; a long-lived connection
+# with a generous cache means each query is only prepared once per thread.
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA foreign_keys=ON",
+)
+
+BADGE_CACHE_SIZE = 512
+
+SITUATIONS = ("recherche", "en_fuite", "RAS", "endette", "malfrat")
+
+STAT_FIELDS = ("vigueur", "agilite", "intelligence", "ruse", "volonte", "presence")
+
+STAT_RANGE = (1, 20)
+
+# Balances may go negative (a character can be in debt): transfers, debits
+# and batch adjustments are not capped. The admin form and roster imports
+# accept this range.
+CREDIT_RANGE = (-1000000, 1000000)
+
+# Column order of roster files (CSV header / JSON Lines keys).
+ROSTER_FIELDS = ("badge_id", "file_path", "nom_perso", *STAT_FIELDS, "credits", "situation")
+
+EXPORT_FETCH_SIZE = 500
+
+# Explicit column list for every character query: the row factory decodes
+# by position, so it must not depend on the physical table layout.
+CHARACTER_COLUMNS = (
+    "id, badge_id, timestamp, file_path, nom_perso, "
+    "vigueur, agilite, intelligence, ruse, volonte, presence, credits, situation"
+)
+
+
+class Character:
+    __slots__ = ('id', 'badge_id', 'timestamp', 'file_path', 'nom_perso',
+                 'vigueur', 'agilite', 'intelligence', 'ruse', 'volonte', 'presence',
+                 'credits', 'situation')
+
+    def __init__(self, row):
+        (self.id, self.badge_id, self.timestamp, self.file_path, self.nom_perso,
+         self.vigueur, self.agilite, self.intelligence, self.ruse, self.volonte,
+         self.presence, self.credits, self.situation) = row
+
+    def __repr__(self):
+        return f"Character(badge_id={self.badge_id!r}, nom_perso={self.nom_perso!r})"
+
+
+def character_factory(cursor, row):
+    return Character(row)
+
+
+SCAN_EVENT_COLUMNS = "id, badge_id, reader_id, scanned_at, resolved"
+
+
+class ScanEvent:
+    __slots__ = ('id', 'badge_id', 'reader_id', 'scanned_at', 'resolved')
+
+    def __init__(self, row):
+        (self.id, self.badge_id, self.reader_id, self.scanned_at, resolved) = row
+        self.resolved = bool(resolved)
+
+    def __repr__(self):
+        return (f"ScanEvent(badge_id={self.badge_id!r}, reader_id={self.reader_id!r}, "
+                f"scanned_at={self.scanned_at!r}, resolved={self.resolved!r})")
+
+
+def scan_event_factory(cursor, row):
+    return ScanEvent(row)
+
+
+LEDGER_COLUMNS = "id, badge_id, delta, balance, reason, transfer_id, created_at"
+
+
+class LedgerEntry:
+    __slots__ = ('id', 'badge_id', 'delta', 'balance', 'reason', 'transfer_id', 'created_at')
+
+    def __init__(self, row):
+        (self.id, self.badge_id, self.delta, self.balance, self.reason,
+         self.transfer_id, self.created_at) = row
+
+    def __repr__(self):
+        return (f"LedgerEntry(badge_id={self.badge_id!r}, delta={self.delta!r}, "
+                f"balance={self.balance!r}, reason={self.reason!r})")
+
+
+def ledger_factory(cursor, row):
+    return LedgerEntry(row)
+
+
+class RosterError(ValueError):
+    pass
+
+
+class CreditError(ValueError):
+    pass
+
+
+class _Connection(sqlite3.Connection):
+    # Last PRAGMA data_version seen on this connection, see _sync_badge_cache().
+    data_version = None
+
+
+class ConnectionManager:
+    # One persistent connection per (thread, database path). The GUI thread,
+    # the serial thread and any worker each get their own connection, opened
+    # on first use and reused afterwards.
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def get(self, path):
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(path)
+        if conn is None:
+            conn = conns[path] = self._open(path)
+        return conn
+
+    def _open(self, path):
+        # check_same_thread=False only so close_all() can close connections
+        # owned by other threads at shutdown; each one is still used by a
+        # single thread.
+        conn = sqlite3.connect(path, timeout=10, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE,
+                               factory=_Connection)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def close_thread(self):
+        conns = getattr(self._local, 'conns', None)
+        if not conns:
+            return
+        with self._lock:
+            for conn in conns.values():
+                if conn in self._all:
+                    self._all.remove(conn)
+                conn.close()
+        conns.clear()
+
+    def close_all(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+        # Other threads' thread-local dicts still reference the closed
+        # connections; a new local namespace forces them to reopen.
+        self._local = threading.local()
+
+
+class BadgeCache:
+    # Bounded LRU of get_character_by_badge() results, including misses so
+    # that repeated scans of an unknown badge are answered from memory too.
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.roster_version = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a lookup that raced with a write
+        # does not put a stale row back (see put()).
+        self._generation = 0
+
+    def get(self, badge_id):
+        with self._lock:
+            if badge_id in self._data:
+                self._data.move_to_end(badge_id)
+                self.hits += 1
+                return True, self._data[badge_id], self._generation
+            self.misses += 1
+            return False, None, self._generation
+
+    def put(self, badge_id, row, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[badge_id] = row
+            self._data.move_to_end(badge_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, badge_id):
+        with self._lock:
+            self._data.pop(badge_id, None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def clear(self, roster_version=None):
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+            self.invalidations += 1
+            self.roster_version = roster_version
+
+    def validate(self, roster_version):
+        if roster_version != self.roster_version:
+            self.clear(roster_version)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
+
+
+_manager = ConnectionManager()
+_badge_cache = BadgeCache(BADGE_CACHE_SIZE)
+# Every mutation goes through this one thread; see app/db_writer.py.
+_writer = DatabaseWriter(lambda: get_connection(), lambda: close_thread_connection())
+
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    return _manager.get(DB_PATH)
 
-def init_database():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
+def close_thread_connection():
+    _manager.close_thread()
+
+def close_all_connections():
+    _writer.stop()
+    _manager.close_all()
+
+def writer_stats():
+    return _writer.stats()
+
+def submit_write(fn, *args, on_commit=None, exclusive=False):
+    # Entry point for mutations defined outside this module (see
+    # app/batch_ops.py); fn(conn, *args) runs on the writer thread.
+    return _writer.submit(fn, *args, on_commit=on_commit, exclusive=exclusive)
+
+def badge_cache_stats():
+    return _badge_cache.stats()
+
+def clear_badge_cache():
+    _badge_cache.clear()
+
+def _sync_badge_cache(conn):
+    # PRAGMA data_version changes whenever another connection (another
+    # thread or another process) commits. Only then do we pay for reading
+    # roster_version, which the rfid_log triggers bump on every change, so
+    # commits touching other tables leave the cache alone.
+    version = conn.execute('PRAGMA data_version').fetchone()[0]
+    if version != conn.data_version:
+        conn.data_version = version
+        roster = conn.execute('SELECT version FROM roster_version').fetchone()
+        _badge_cache.validate(roster[0] if roster else None)
+
+def _migrate_1(conn):
+    # Baseline schema, as created before versioning existed. Databases from
+    # that era report user_version 0 and already have these objects.
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS rfid_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             badge_id TEXT NOT NULL UNIQUE,
@@ -31,78 +302,420 @@ def init_database():
             credits INTEGER DEFAULT 100
         )
     ''')
-    conn.commit()
-    conn.close()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS roster_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO roster_version (id, version) VALUES (1, 0)')
+    _create_roster_triggers(conn)
 
-def get_all_characters():
+def _migrate_2(conn):
+    # Replace the five mutually exclusive situation booleans by a single
+    # indexed column. SQLite cannot alter column lists in place, so the
+    # table is rebuilt and renamed; dropping it also drops its triggers.
+    situation_list = ", ".join(f"'{s}'" for s in SITUATIONS)
+    conn.execute(f'''
+        CREATE TABLE rfid_log_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            badge_id TEXT NOT NULL UNIQUE,
+            flemme NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            file_path TEXT DEFAULT '',
+            nom_perso TEXT,
+            vigueur INTEGER DEFAULT 5,
+            agilite INTEGER DEFAULT 5,
+            intelligence INTEGER DEFAULT 5,
+            ruse INTEGER DEFAULT 5,
+            volonte INTEGER DEFAULT 5,
+            presence INTEGER DEFAULT 5,
+            credits INTEGER DEFAULT 100,
+            situation TEXT NOT NULL DEFAULT 'RAS' CHECK (situation IN ({situation_list}))
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO rfid_log_v2
+            (id, badge_id, flemme, timestamp, file_path, nom_perso, vigueur, agilite,
+             intelligence, ruse, volonte, presence, credits, situation)
+        SELECT id, badge_id, flemme, timestamp, file_path, nom_perso, vigueur, agilite,
+               intelligence, ruse, volonte, presence, credits,
+               CASE
+                   WHEN recherche = 1 THEN 'recherche'
+                   WHEN en_fuite = 1 THEN 'en_fuite'
+                   WHEN RAS = 1 THEN 'RAS'
+                   WHEN endette = 1 THEN 'endette'
+                   WHEN malfrat = 1 THEN 'malfrat'
+                   ELSE 'RAS'
+               END
+        FROM rfid_log
+    ''')
+    conn.execute('DROP TABLE rfid_log')
+    conn.execute('ALTER TABLE rfid_log_v2 RENAME TO rfid_log')
+    conn.execute('CREATE INDEX idx_rfid_log_situation ON rfid_log (situation)')
+    conn.execute('CREATE INDEX idx_rfid_log_nom_perso ON rfid_log (nom_perso)')
+    _create_roster_triggers(conn)
+
+def _migrate_3(conn):
+    # Append-only scan history, written in batches by app.scan_log.
+    conn.execute('''
+        CREATE TABLE scan_events (
+            id INTEGER PRIMARY KEY,
+            badge_id TEXT NOT NULL,
+            reader_id TEXT NOT NULL,
+            scanned_at REAL NOT NULL,
+            resolved INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_scan_events_badge ON scan_events (badge_id, scanned_at)')
+    conn.execute('CREATE INDEX idx_scan_events_time ON scan_events (scanned_at)')
+    conn.execute('''
+        CREATE TRIGGER scan_events_append_only
+        BEFORE UPDATE ON scan_events
+        BEGIN
+            SELECT RAISE(ABORT, 'scan_events est en ajout seul');
+        END
+    ''')
+
+def _migrate_4(conn):
+    # Credit ledger: every change to rfid_log.credits is recorded with the
+    # resulting balance, so SUM(delta) per badge must equal its credits (see
+    # check_ledger). Existing balances are carried over as opening entries.
+    conn.execute('''
+        CREATE TABLE credit_ledger (
+            id INTEGER PRIMARY KEY,
+            badge_id TEXT NOT NULL,
+            delta INTEGER NOT NULL,
+            balance INTEGER NOT NULL,
+            reason TEXT NOT NULL DEFAULT '',
+            transfer_id INTEGER,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_credit_ledger_badge ON credit_ledger (badge_id, id)')
+    conn.execute('''
+        CREATE TRIGGER credit_ledger_append_only
+        BEFORE UPDATE ON credit_ledger
+        BEGIN
+            SELECT RAISE(ABORT, 'credit_ledger est en ajout seul');
+        END
+    ''')
+    conn.execute('''
+        INSERT INTO credit_ledger (badge_id, delta, balance, reason, created_at)
+        SELECT badge_id, COALESCE(credits, 0), COALESCE(credits, 0), 'ouverture', ?
+        FROM rfid_log
+    ''', (time.time(),))
+
+def _migrate_5(conn):
+    # Canonical badge IDs (see app.badge_key) and the badge_key lookup
+    # column. IDs saved before the sketch zero-padded its output, such as
+    # "a:1b:2c:3d", are rewritten in every table. If two characters
+    # normalize to the same badge, only one of them could ever be scanned:
+    # the most recently created one is kept (timestamp is set on insert and
+    # never updated), and the other is closed in the ledger before being
+    # removed. The pre-migration backup still holds it.
+    conn.execute('ALTER TABLE rfid_log ADD COLUMN badge_key')
+    rows = conn.execute('''
+        SELECT id, badge_id, COALESCE(credits, 0) FROM rfid_log
+        ORDER BY timestamp DESC, id DESC
+    ''').fetchall()
+    kept = {}
+    for row_id, badge_id, credits in rows:
+        canonical = normalize_badge_id(badge_id)
+        if canonical not in kept:
+            kept[canonical] = row_id
+            continue
+        if credits:
+            _record_credits(conn, badge_id, -credits, 0, "fusion doublon")
+        conn.execute('DELETE FROM rfid_log WHERE id = ?', (row_id,))
+    conn.executemany('UPDATE rfid_log SET badge_id = ?, badge_key = ? WHERE id = ?',
+                     ((canonical, badge_key(canonical), row_id)
+                      for canonical, row_id in kept.items()))
+    conn.execute('CREATE UNIQUE INDEX idx_rfid_log_badge_key ON rfid_log (badge_key)')
+
+    for table in ('scan_events', 'credit_ledger'):
+        renames = []
+        for (badge_id,) in conn.execute(f'SELECT DISTINCT badge_id FROM {table}').fetchall():
+            canonical = normalize_badge_id(badge_id)
+            if canonical != badge_id:
+                renames.append((canonical, badge_id))
+        if not renames:
+            continue
+        # Both tables are append-only; lift the guard for the rewrite.
+        triggers = conn.execute('''
+            SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?
+        ''', (table,)).fetchall()
+        for name, _ in triggers:
+            conn.execute(f'DROP TRIGGER {name}')
+        conn.executemany(f'UPDATE {table} SET badge_id = ? WHERE badge_id = ?', renames)
+        for _, sql in triggers:
+            conn.execute(sql)
+
+def _create_roster_triggers(conn):
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS rfid_log_roster_{event.lower()}
+            AFTER {event} ON rfid_log
+            BEGIN
+                UPDATE roster_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+# Schema history: MIGRATIONS[n] brings a database from user_version n to
+# n + 1. Only ever append; released steps must never change, since existing
+# databases have already run them.
+MIGRATIONS = (
+    _migrate_1,
+    _migrate_2,
+    _migrate_3,
+    _migrate_4,
+    _migrate_5,
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn=None):
+    conn = conn or get_connection()
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+@traced("db")
+def migrate(conn):
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Base de données en version {version}, cette application ne gère que "
+            f"la version {SCHEMA_VERSION}. Mettez l'application à jour.")
+    if version == SCHEMA_VERSION:
+        return version
+
+    has_data = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rfid_log'").fetchone()
+    if has_data:
+        _backup_before_migration(conn, version)
+
+    # Table rebuilds need foreign key enforcement off, and the pragma is a
+    # no-op inside a transaction.
+    conn.execute('PRAGMA foreign_keys=OFF')
+    try:
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                MIGRATIONS[target - 1](conn)
+                problems = conn.execute('PRAGMA foreign_key_check').fetchall()
+                if problems:
+                    raise sqlite3.IntegrityError(
+                        f"Migration {target}: clés étrangères invalides {problems[:5]}")
+                conn.execute(f'PRAGMA user_version = {target}')
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    finally:
+        conn.execute('PRAGMA foreign_keys=ON')
+    return SCHEMA_VERSION
+
+def _backup_before_migration(conn, version):
+    if DB_PATH == ':memory:':
+        return
+    backup_path = f"{DB_PATH}.v{version}.bak"
+    if os.path.exists(backup_path):
+        return
+    target = sqlite3.connect(backup_path)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+
+@traced("db")
+def init_database():
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM rfid_log ORDER BY nom_perso')
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    migrate(conn)
+    conn.data_version = None
+    _badge_cache.clear()
+
+@traced("db")
+def get_all_characters():
+    cursor = get_connection().cursor()
+    cursor.row_factory = character_factory
+    return cursor.execute(f'SELECT {CHARACTER_COLUMNS} FROM rfid_log ORDER BY nom_perso').fetchall()
 
+@traced("db")
 def get_character_by_badge(badge_id):
+    key = badge_key(badge_id)
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM rfid_log WHERE badge_id = ?', (badge_id,))
-    row = cursor.fetchone()
-    conn.close()
+    _sync_badge_cache(conn)
+    found, row, generation = _badge_cache.get(key)
+    if found:
+        return row
+    row = _select_character(conn, key)
+    _badge_cache.put(key, row, generation)
     return row
 
+def _select_character(conn, key):
+    cursor = conn.cursor()
+    cursor.row_factory = character_factory
+    return cursor.execute(f'SELECT {CHARACTER_COLUMNS} FROM rfid_log WHERE badge_key = ?',
+                          (key,)).fetchone()
+
+# Mutations return a concurrent.futures.Future resolved by the writer
+# thread once the change is committed; call .result() to wait for it.
+# Badge IDs are normalized here (see app.badge_key); the underscore
+# functions expect canonical IDs.
+
 def add_character(badge_id, file_path, nom_perso, vigueur, agilite, intelligence, 
                   ruse, volonte, presence, credits, situation):
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    bool_values = get_situation_bools(situation)
-    
-    cursor.execute('''INSERT INTO rfid_log 
-        (badge_id, file_path, nom_perso, vigueur, agilite, intelligence, ruse, volonte, presence, credits,
-         recherche, en_fuite, RAS, endette, malfrat) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+    badge_id = normalize_badge_id(badge_id)
+    return _writer.submit(_insert_character,
+                          (badge_id, file_path, nom_perso, vigueur, agilite, intelligence,
+                           ruse, volonte, presence, credits, situation),
+                          on_commit=partial(_badge_cache.invalidate, badge_key(badge_id)))
+
+@traced("db")
+def _insert_character(conn, values):
+    conn.execute('''INSERT INTO rfid_log 
         (badge_id, file_path, nom_perso, vigueur, agilite, intelligence, ruse, volonte, presence, credits,
-         *bool_values))
-    conn.commit()
-    conn.close()
+         situation, badge_key) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (*values, badge_key(values[0])))
+    credits = values[9] or 0
+    _record_credits(conn, values[0], credits, credits, "ouverture")
 
 def update_character(badge_id, file_path, nom_perso, vigueur, agilite, intelligence,
-                     ruse, volonte, presence, credits, situation):
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    bool_values = get_situation_bools(situation)
-    
-    cursor.execute('''
-        UPDATE rfid_log SET 
-        file_path = ?, nom_perso = ?, vigueur = ?, agilite = ?, intelligence = ?,
-        ruse = ?, volonte = ?, presence = ?, credits = ?,
-        recherche = ?, en_fuite = ?, RAS = ?, endette = ?, malfrat = ?
-        WHERE badge_id = ?
-    ''', (file_path, nom_perso, vigueur, agilite, intelligence, ruse, volonte, presence, credits,
-          *bool_values, badge_id))
-    conn.commit()
-    conn.close()
+                     ruse, volonte, presence, credits, situation, credits_delta=0):
+    # credits=None leaves the balance alone; credits_delta is then applied
+    # like apply_credits() in the same transaction, so concurrent credit
+    # changes made elsewhere are kept.
+    badge_id = normalize_badge_id(badge_id)
+    return _writer.submit(_update_character,
+                          (file_path, nom_perso, vigueur, agilite, intelligence, ruse, volonte,
+                           presence, credits, situation, badge_id), int(credits_delta),
+                          on_commit=partial(_badge_cache.invalidate, badge_key(badge_id)))
+
+@traced("db")
+def _update_character(conn, values, credits_delta=0):
+    credits, key = values[8], badge_key(values[10])
+    if credits is None:
+        conn.execute('''
+            UPDATE rfid_log SET
+            file_path = ?, nom_perso = ?, vigueur = ?, agilite = ?, intelligence = ?,
+            ruse = ?, volonte = ?, presence = ?, situation = ?
+            WHERE badge_key = ?
+        ''', (*values[:8], values[9], key))
+    else:
+        conn.execute('''
+            INSERT INTO credit_ledger (badge_id, delta, balance, reason, created_at)
+            SELECT badge_id, ? - COALESCE(credits, 0), ?, 'ajustement', ?
+            FROM rfid_log WHERE badge_key = ? AND COALESCE(credits, 0) != ?
+        ''', (credits, credits, time.time(), key, credits))
+        conn.execute('''
+            UPDATE rfid_log SET 
+            file_path = ?, nom_perso = ?, vigueur = ?, agilite = ?, intelligence = ?,
+            ruse = ?, volonte = ?, presence = ?, credits = ?, situation = ?
+            WHERE badge_key = ?
+        ''', (*values[:10], key))
+    if credits_delta:
+        _apply_credits(conn, values[10], credits_delta, 'ajustement')
 
 def delete_character(badge_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM rfid_log WHERE badge_id = ?", (badge_id,))
-    conn.commit()
-    conn.close()
+    badge_id = normalize_badge_id(badge_id)
+    return _writer.submit(_delete_character, badge_id,
+                          on_commit=partial(_badge_cache.invalidate, badge_key(badge_id)))
+
+@traced("db")
+def _delete_character(conn, badge_id):
+    key = badge_key(badge_id)
+    # Close the account so the ledger stays balanced if the badge is reused.
+    conn.execute('''
+        INSERT INTO credit_ledger (badge_id, delta, balance, reason, created_at)
+        SELECT badge_id, -COALESCE(credits, 0), 0, 'suppression', ?
+        FROM rfid_log WHERE badge_key = ? AND COALESCE(credits, 0) != 0
+    ''', (time.time(), key))
+    conn.execute("DELETE FROM rfid_log WHERE badge_key = ?", (key,))
+
+def apply_credits(badge_id, delta, reason=""):
+    # Atomic server-side increment (credits = credits + delta) recorded in the
+    # ledger; resolves to the new balance.
+    badge_id = normalize_badge_id(badge_id)
+    return _writer.submit(_apply_credits, badge_id, int(delta), reason,
+                          on_commit=partial(_badge_cache.invalidate, badge_key(badge_id)))
+
+@traced("db")
+def _apply_credits(conn, badge_id, delta, reason, transfer_id=None):
+    key = badge_key(badge_id)
+    cursor = conn.execute(
+        'UPDATE rfid_log SET credits = COALESCE(credits, 0) + ? WHERE badge_key = ?',
+        (delta, key))
+    if cursor.rowcount == 0:
+        raise CreditError(f"Badge inconnu: {badge_id}")
+    balance = conn.execute('SELECT credits FROM rfid_log WHERE badge_key = ?',
+                           (key,)).fetchone()[0]
+    _record_credits(conn, badge_id, delta, balance, reason, transfer_id)
+    return balance
+
+def transfer_credits(from_badge, to_badge, amount, reason=""):
+    # Both legs commit or neither does; resolves to (from_balance, to_balance).
+    from_badge = normalize_badge_id(from_badge)
+    to_badge = normalize_badge_id(to_badge)
+
+    def invalidate():
+        _badge_cache.invalidate(badge_key(from_badge))
+        _badge_cache.invalidate(badge_key(to_badge))
+    return _writer.submit(_transfer_credits, from_badge, to_badge, int(amount), reason,
+                          on_commit=invalidate)
+
+@traced("db")
+def _transfer_credits(conn, from_badge, to_badge, amount, reason):
+    if amount <= 0:
+        raise CreditError(f"Montant de transfert invalide: {amount}")
+    if from_badge == to_badge:
+        raise CreditError("Transfert vers le même badge")
+    # The two legs share a transfer_id: the ledger id of the debit.
+    transfer_id = conn.execute(
+        'SELECT COALESCE(MAX(id), 0) + 1 FROM credit_ledger').fetchone()[0]
+    from_balance = _apply_credits(conn, from_badge, -amount, reason, transfer_id)
+    to_balance = _apply_credits(conn, to_badge, amount, reason, transfer_id)
+    return from_balance, to_balance
+
+def _record_credits(conn, badge_id, delta, balance, reason, transfer_id=None):
+    conn.execute('''
+        INSERT INTO credit_ledger (badge_id, delta, balance, reason, transfer_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (badge_id, delta, balance, reason, transfer_id, time.time()))
+
+@traced("db")
+def get_credit_history(badge_id, limit=100):
+    cursor = get_connection().cursor()
+    cursor.row_factory = ledger_factory
+    return cursor.execute(f'''
+        SELECT {LEDGER_COLUMNS} FROM credit_ledger
+        WHERE badge_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (normalize_badge_id(badge_id), limit)).fetchall()
+
+def get_ledger_balance(badge_id):
+    return get_connection().execute(
+        'SELECT COALESCE(SUM(delta), 0) FROM credit_ledger WHERE badge_id = ?',
+        (normalize_badge_id(badge_id),)).fetchone()[0]
 
-def get_situation_bools(situation):
-    situations = ["recherche", "en_fuite", "RAS", "endette", "malfrat"]
-    return [1 if s == situation else 0 for s in situations]
+@traced("db")
+def check_ledger():
+    # Returns (badge_id, credits, ledger_total) for every character whose
+    # stored balance disagrees with its ledger; an empty list means the two
+    # are consistent.
+    return get_connection().execute('''
+        SELECT r.badge_id, COALESCE(r.credits, 0), COALESCE(l.total, 0)
+        FROM rfid_log r
+        LEFT JOIN (SELECT badge_id, SUM(delta) AS total
+                   FROM credit_ledger GROUP BY badge_id) l
+            ON l.badge_id = r.badge_id
+        WHERE COALESCE(r.credits, 0) != COALESCE(l.total, 0)
+        ORDER BY r.badge_id
+    ''').fetchall()
 
 def get_situation_from_row(row):
     if row is None:
         return "RAS"
-    bool_column_names = ["recherche", "en_fuite", "RAS", "endette", "malfrat"]
-    for i, name in enumerate(bool_column_names):
-        if row[12 + i] == 1:
-            return name
-    return "RAS"
+    return row.situation
 
 def get_situation_display(situation):
     mapping = {
@@ -113,3 +726,213 @@ def get_situation_display(situation):
         "malfrat": "Malfrat"
     }
     return mapping.get(situation, "Rien à signaler")
+
+def validate_character(record, line=None):
+    # Turns one roster record (dict with ROSTER_FIELDS keys, values possibly
+    # strings as read from CSV) into a tuple in ROSTER_FIELDS order.
+    where = f"ligne {line}: " if line is not None else ""
+    badge_id = normalize_badge_id(record.get("badge_id") or "")
+    nom_perso = str(record.get("nom_perso") or "").strip()
+    if not badge_id:
+        raise RosterError(f"{where}badge_id manquant")
+    if not nom_perso:
+        raise RosterError(f"{where}nom_perso manquant pour {badge_id}")
+
+    values = [badge_id, str(record.get("file_path") or "").strip(), nom_perso]
+    low, high = STAT_RANGE
+    for field in STAT_FIELDS:
+        value = _as_int(record.get(field), 5, field, where)
+        if not low <= value <= high:
+            raise RosterError(f"{where}{field}={value} hors de [{low}, {high}]")
+        values.append(value)
+    credits = _as_int(record.get("credits"), 100, "credits", where)
+    low, high = CREDIT_RANGE
+    if not low <= credits <= high:
+        raise RosterError(f"{where}credits={credits} hors de [{low}, {high}]")
+    values.append(credits)
+
+    situation = str(record.get("situation") or "RAS").strip()
+    if situation not in SITUATIONS:
+        raise RosterError(f"{where}situation inconnue: {situation!r}")
+    values.append(situation)
+    return tuple(values)
+
+def _as_int(value, default, field, where):
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RosterError(f"{where}{field} n'est pas un entier: {value!r}") from None
+
+def import_characters(records):
+    # Upserts an iterable of roster records in a single transaction on the
+    # writer thread; records are validated and inserted as they stream in,
+    # and any invalid record rolls the whole import back. The future
+    # resolves to the number of records imported.
+    return _writer.submit(_import_characters, enumerate(records, start=1),
+                          on_commit=_badge_cache.clear, exclusive=True)
+
+def import_csv(path):
+    return _writer.submit(_import_file, path, _read_csv,
+                          on_commit=_badge_cache.clear, exclusive=True)
+
+def import_jsonl(path):
+    return _writer.submit(_import_file, path, _read_jsonl,
+                          on_commit=_badge_cache.clear, exclusive=True)
+
+def _import_file(conn, path, reader):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return _import_characters(conn, reader(f))
+
+# File readers yield (line, record), line being the record's line in the
+# file, so errors point at the line to fix.
+
+def _read_csv(f):
+    header = f.readline()
+    f.seek(0)
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    reader = csv.DictReader(f, delimiter=delimiter)
+    try:
+        for record in reader:
+            yield reader.line_num, record
+    except csv.Error as e:
+        raise RosterError(f"ligne {reader.line_num}: CSV invalide ({e})") from None
+
+def _read_jsonl(f):
+    for number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise RosterError(f"ligne {number}: JSON invalide ({e.msg})") from None
+        if not isinstance(record, dict):
+            raise RosterError(f"ligne {number}: objet JSON attendu")
+        yield number, record
+
+@traced("db")
+def _import_characters(conn, numbered):
+    # numbered yields (line, record); import_characters() numbers plain
+    # records from 1.
+    count = 0
+
+    def validated():
+        nonlocal count
+        for line, record in numbered:
+            values = validate_character(record, line)
+            count += 1
+            yield (*values, badge_key(values[0]))
+
+    # Records are staged in a temp table first so credit changes can be
+    # written to the ledger in one set-based statement before the upsert.
+    # Within a file the last record for a badge wins, as in sequential saves.
+    columns = ", ".join((*ROSTER_FIELDS, "badge_key"))
+    conn.execute(f'''
+        CREATE TEMP TABLE IF NOT EXISTS roster_import (
+            {columns}, PRIMARY KEY (badge_id)
+        )
+    ''')
+    conn.execute('DELETE FROM temp.roster_import')
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO temp.roster_import ({columns})
+        VALUES ({", ".join("?" for _ in range(len(ROSTER_FIELDS) + 1))})
+    ''', validated())
+    conn.execute('''
+        INSERT INTO credit_ledger (badge_id, delta, balance, reason, created_at)
+        SELECT i.badge_id, i.credits - COALESCE(r.credits, 0), i.credits,
+               CASE WHEN r.badge_id IS NULL THEN 'ouverture' ELSE 'import' END, ?
+        FROM temp.roster_import i
+        LEFT JOIN rfid_log r ON r.badge_key = i.badge_key
+        WHERE r.badge_id IS NULL OR COALESCE(r.credits, 0) != i.credits
+    ''', (time.time(),))
+    conn.execute(f'''
+        INSERT INTO rfid_log ({columns})
+        SELECT {columns} FROM temp.roster_import WHERE true
+        ON CONFLICT (badge_id) DO UPDATE SET
+        {", ".join(f"{field} = excluded.{field}" for field in ROSTER_FIELDS[1:])}
+    ''')
+    conn.execute('DELETE FROM temp.roster_import')
+    return count
+
+def export_characters():
+    # Streams the roster as dicts in ROSTER_FIELDS order, EXPORT_FETCH_SIZE
+    # rows at a time, so memory stays flat whatever the roster size. The
+    # span is opened inside the generator (traced() would only time its
+    # creation) and covers the whole export, consumer included.
+    with span("export_characters", "db"):
+        cursor = get_connection().cursor()
+        cursor.execute(f'SELECT {", ".join(ROSTER_FIELDS)} FROM rfid_log ORDER BY badge_id')
+        try:
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(ROSTER_FIELDS, row))
+        finally:
+            cursor.close()
+
+def export_csv(path):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=ROSTER_FIELDS)
+        writer.writeheader()
+        for count, record in enumerate(export_characters(), start=1):
+            writer.writerow(record)
+    return count
+
+def export_jsonl(path):
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for count, record in enumerate(export_characters(), start=1):
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+    return count
+
+def insert_scan_events(events):
+    # events: list of (badge_id, reader_id, scanned_at). Whether the badge
+    # resolved to a character is decided here, at insert time, so the caller
+    # never has to touch rfid_log.
+    return _writer.submit(_insert_scan_events, events)
+
+@traced("db")
+def _insert_scan_events(conn, events):
+    def rows():
+        for badge_id, reader_id, scanned_at in events:
+            badge_id = normalize_badge_id(badge_id)
+            yield badge_id, reader_id, scanned_at, badge_key(badge_id)
+
+    conn.executemany('''
+        INSERT INTO scan_events (badge_id, reader_id, scanned_at, resolved)
+        VALUES (?, ?, ?, EXISTS (SELECT 1 FROM rfid_log WHERE badge_key = ?))
+    ''', rows())
+
+def get_scan_history(badge_id, limit=100):
+    cursor = get_connection().cursor()
+    cursor.row_factory = scan_event_factory
+    return cursor.execute(f'''
+        SELECT {SCAN_EVENT_COLUMNS} FROM scan_events
+        WHERE badge_id = ?
+        ORDER BY scanned_at DESC
+        LIMIT ?
+    ''', (normalize_badge_id(badge_id), limit)).fetchall()
+
+def get_scans_between(start, end, reader_id=None):
+    # start/end are Unix timestamps (time.time()), start inclusive, end exclusive.
+    cursor = get_connection().cursor()
+    cursor.row_factory = scan_event_factory
+    if reader_id is None:
+        return cursor.execute(f'''
+            SELECT {SCAN_EVENT_COLUMNS} FROM scan_events
+            WHERE scanned_at >= ? AND scanned_at < ?
+            ORDER BY scanned_at
+        ''', (start, end)).fetchall()
+    return cursor.execute(f'''
+        SELECT {SCAN_EVENT_COLUMNS} FROM scan_events
+        WHERE scanned_at >= ? AND scanned_at < ? AND reader_id = ?
+        ORDER BY scanned_at
+    ''', (start, end, reader_id)).fetchall()
+
+atexit.register(_writer.stop)
@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+MAX_BATCH = 500
+
+
+class _Operation:
+    __slots__ = ('future', 'fn', 'args', 'on_commit', 'exclusive')
+
+    def __init__(self, future, fn, args, on_commit, exclusive):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.on_commit = on_commit
+        self.exclusive = exclusive
+
+
+class DatabaseWriter:
+    # Single writer thread for every mutation. Callers submit fn(conn, *args)
+    # and get a Future back; the thread drains whatever is queued and runs it
+    # as one transaction (group commit), each operation inside its own
+    # savepoint so a failing operation only fails its own future.
+    #
+    # on_commit callbacks run on the writer thread after COMMIT succeeds and
+    # before the futures resolve, so a caller woken by result() never sees
+    # state that predates its write (e.g. a stale cache entry).
+    #
+    # A savepoint is only taken when a transaction holds several operations.
+    # Large statements pay heavily for the statement journal a savepoint
+    # implies (a bulk upsert runs ~6x slower), so such operations are
+    # submitted with exclusive=True and always get a transaction of their own.
+    #
+    # Never wait on a future from inside an operation: the writer would be
+    # waiting on itself.
+    #
+    # connect() is called on the writer thread when it starts, and
+    # disconnect(), if given, on the same thread when it stops.
+
+    def __init__(self, connect, disconnect=None, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self.operations = 0
+        self.commits = 0
+        self.failed = 0
+        self.largest_batch = 0
+        self.busy_time = 0.0
+        self._connect = connect
+        self._disconnect = disconnect
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, fn, *args, on_commit=None, exclusive=False):
+        future = Future()
+        self._ensure_started()
+        self._queue.put(_Operation(future, fn, args, on_commit, exclusive))
+        return future
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+
+    def stats(self):
+        return {
+            'operations': self.operations,
+            'commits': self.commits,
+            'failed': self.failed,
+            'largest_batch': self.largest_batch,
+            'mean_batch': self.operations / self.commits if self.commits else 0.0,
+            'pending': self._queue.qsize(),
+            'busy_time': self.busy_time,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            self._serve(conn)
+        finally:
+            if self._disconnect is not None:
+                self._disconnect()
+
+    def _serve(self, conn):
+        # Transactions are managed explicitly below; keep the sqlite3 module
+        # from opening its own behind our back.
+        conn.isolation_level = None
+        stop = False
+        while not stop:
+            op = self._queue.get()
+            batch = []
+            while True:
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if stop:
+                # Drain what was queued before stop().
+                while True:
+                    try:
+                        op = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if op is not None:
+                        batch.append(op)
+            group = []
+            for op in batch:
+                if not op.future.set_running_or_notify_cancel():
+                    continue
+                if op.exclusive:
+                    self._execute(conn, group)
+                    self._execute(conn, [op])
+                    group = []
+                else:
+                    group.append(op)
+            self._execute(conn, group)
+
+    def _execute(self, conn, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if len(batch) == 1:
+                op = batch[0]
+                try:
+                    outcomes.append((op, op.fn(conn, *op.args), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK')
+                    self.failed += 1
+                    op.future.set_exception(e)
+                    return
+            else:
+                for op in batch:
+                    conn.execute('SAVEPOINT op')
+                    try:
+                        result = op.fn(conn, *op.args)
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO op')
+                        conn.execute('RELEASE op')
+                        outcomes.append((op, None, e))
+                    else:
+                        conn.execute('RELEASE op')
+                        outcomes.append((op, result, None))
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self.failed += len(batch)
+            for op in batch:
+                op.future.set_exception(e)
+            return
+        finally:
+            self.busy_time += time.perf_counter() - start
+
+        self.commits += 1
+        self.operations += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for op, result, error in outcomes:
+            if error is None and op.on_commit is not None:
+                try:
+                    op.on_commit()
+                except Exception:
+                    pass
+        for op, result, error in outcomes:
+            if error is None:
+                op.future.set_result(result)
+            else:
+                self.failed += 1
+                op.future.set_exception(error)
@@ -0,0 +1,108 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+    QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog, QMessageBox
+)
+from PyQt5.QtCore import Qt, QTimer
+from app.latency import STAGES, get_latency_tracker
+from app import tracing
+from app.meshes import get_mesh_cache
+
+REFRESH_INTERVAL = 1000
+COLUMNS = ("Étape", "Nombre", "p50 (ms)", "p95 (ms)", "p99 (ms)", "max (ms)")
+VALUE_KEYS = ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+
+
+class DiagnosticsWindow(QDialog):
+    # Live view of the scan-to-display latency histograms, refreshed while
+    # the window is open.
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tracker = get_latency_tracker()
+        self.setup_ui()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def setup_ui(self):
+        self.setWindowTitle("Diagnostics - Latence des scans")
+        self.resize(620, 380)
+        layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(len(STAGES), len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        for row, (_, label) in enumerate(STAGES):
+            self.table.setItem(row, 0, QTableWidgetItem(label))
+        layout.addWidget(self.table)
+
+        self.summary_label = QLabel("")
+        self.summary_label.setStyleSheet("color: #888888; font-size: 11px;")
+        layout.addWidget(self.summary_label)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        reset_btn = QPushButton("Réinitialiser")
+        reset_btn.clicked.connect(self.reset)
+        button_layout.addWidget(reset_btn)
+        export_btn = QPushButton("Exporter JSON...")
+        export_btn.clicked.connect(self.export_json)
+        button_layout.addWidget(export_btn)
+        trace_btn = QPushButton("Exporter la trace...")
+        trace_btn.setEnabled(tracing.enabled())
+        if not tracing.enabled():
+            trace_btn.setToolTip(f"Lancer avec --trace ou {tracing.ENV_VAR} pour activer le traçage")
+        trace_btn.clicked.connect(self.export_trace)
+        button_layout.addWidget(trace_btn)
+        layout.addLayout(button_layout)
+
+    def refresh(self):
+        stats = self.tracker.stats()
+        for row, (name, _) in enumerate(STAGES):
+            summary = stats.get(name, {'count': 0})
+            values = [str(summary['count'])]
+            values += [f"{summary[key]:.2f}" if summary['count'] else "-" for key in VALUE_KEYS]
+            for column, value in enumerate(values, start=1):
+                item = QTableWidgetItem(value)
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+        meshes = get_mesh_cache().stats()
+        self.summary_label.setText(
+            f"{self.tracker.superseded} scans remplacés avant leur affichage — "
+            f"cache de modèles 3D : {meshes['entries']} modèles, "
+            f"{meshes['bytes'] / 1e6:.0f}/{meshes['max_bytes'] / 1e6:.0f} Mo, "
+            f"{meshes['hit_rate']:.0%} de succès")
+
+    def reset(self):
+        self.tracker.reset()
+        self.refresh()
+
+    def export_json(self):
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Exporter les latences", "latences.json", "JSON (*.json)")
+        if not filename:
+            return
+        try:
+            self.tracker.export_json(filename)
+        except OSError as e:
+            QMessageBox.critical(self, "Erreur", f"Export impossible: {e}")
+
+    def export_trace(self):
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Exporter la trace", "trace.json", "Chrome Trace (*.json)")
+        if not filename:
+            return
+        try:
+            tracing.dump(filename)
+        except OSError as e:
+            QMessageBox.critical(self, "Erreur", f"Export impossible: {e}")
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start(REFRESH_INTERVAL)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
@@ -0,0 +1,188 @@
+import json
+import math
+import threading
+import time
+
+# Scan-to-display latency, measured per stage with time.monotonic():
+#
+#   serial   bytes returned by the port read -> scan published by the hub
+#   queue    hub (reader thread) -> MainApplication on the GUI thread
+#   filter   deduplication, including a hold in the coalesce window
+#   dispatch scan accepted -> lookup submitted by UserWindow
+#   lookup   async get_character_by_badge, pool queue included
+#   widgets  name, stats, situation and credits labels
+#   mesh     STL read and pipeline set-up in VTKWidget.load_stl
+#   render   first Render() of the new model (or of the placeholder)
+#   total    port read -> first render, for scans that reached the screen
+#
+# Each stage feeds a log-bucketed histogram, so recording is O(1) and the
+# memory use does not grow with the session.
+STAGES = (
+    ('serial', "Lecture série"),
+    ('queue', "File vers l'interface"),
+    ('filter', "Anti-rebond"),
+    ('dispatch', "Ouverture de la vue"),
+    ('lookup', "Requête base"),
+    ('widgets', "Mise à jour des widgets"),
+    ('mesh', "Chargement STL"),
+    ('render', "Premier rendu VTK"),
+    ('total', "Total lecture → rendu"),
+)
+
+# Buckets start at 1 µs and grow by 2^(1/8) (~9% relative error) up to
+# about 100 s; slower samples land in the last bucket.
+BUCKET_BASE = 1e-6
+BUCKETS_PER_OCTAVE = 8
+BUCKET_COUNT = 216
+
+
+class LatencyHistogram:
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds <= BUCKET_BASE:
+            index = 0
+        else:
+            index = min(BUCKET_COUNT - 1,
+                        int(math.log2(seconds / BUCKET_BASE) * BUCKETS_PER_OCTAVE))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        # Upper edge of the bucket holding the q-th sample, clamped to the
+        # observed range.
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                upper = BUCKET_BASE * 2 ** ((index + 1) / BUCKETS_PER_OCTAVE)
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3),
+            'min_ms': round(self.min * 1000, 3),
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p95_ms': round(self.percentile(95) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class _Timeline:
+    __slots__ = ('seq', 'badge_id', 'started_at', 'last')
+
+    def __init__(self, seq, badge_id, started_at, last):
+        self.seq = seq
+        self.badge_id = badge_id
+        self.started_at = started_at
+        self.last = last
+
+
+class LatencyTracker:
+    # record() is thread-safe and may be called from the reader threads.
+    # The display stages follow one scan at a time: begin() opens a
+    # timeline for the accepted scan, mark() closes the stage that just
+    # ended, finish() records the total. Only the latest scan is shown, so
+    # a scan accepted while the previous one is still on its way replaces
+    # it and the older one is counted as superseded.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: LatencyHistogram() for name, _ in STAGES}
+        self._active = None
+        self.superseded = 0
+        self.started_at = time.time()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def delivered(self, scan, now=None):
+        # Scan arrived on the GUI thread.
+        now = time.monotonic() if now is None else now
+        scan.delivered_at = now
+        if scan.published_at is not None:
+            self.record('queue', now - scan.published_at)
+
+    def begin(self, scan, now=None):
+        now = time.monotonic() if now is None else now
+        if scan.delivered_at is not None:
+            self.record('filter', now - scan.delivered_at)
+        if self._active is not None:
+            self.superseded += 1
+        started_at = scan.read_at if scan.read_at is not None else now
+        self._active = _Timeline(scan.seq, scan.badge_id, started_at, now)
+
+    def mark(self, stage, now=None):
+        timeline = self._active
+        if timeline is None:
+            return
+        now = time.monotonic() if now is None else now
+        self.record(stage, now - timeline.last)
+        timeline.last = now
+
+    def finish(self, stage=None, now=None):
+        timeline = self._active
+        if timeline is None:
+            return
+        now = time.monotonic() if now is None else now
+        if stage is not None:
+            self.record(stage, now - timeline.last)
+        self.record('total', now - timeline.started_at)
+        self._active = None
+
+    def cancel(self):
+        self._active = None
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: LatencyHistogram() for name, _ in STAGES}
+        self._active = None
+        self.superseded = 0
+        self.started_at = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self._histograms.items()}
+
+    def export_json(self, path):
+        report = {
+            'started_at': self.started_at,
+            'exported_at': time.time(),
+            'superseded': self.superseded,
+            'stages': self.stats(),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return report
+
+
+# Created at import: reader threads record into it from the start.
+_tracker = LatencyTracker()
+
+
+def get_latency_tracker():
+    return _tracker
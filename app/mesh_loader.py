@@ -0,0 +1,139 @@
+import itertools
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from app import tracing
+from app.meshes import (
+    LOD_TRIANGLE_BUDGET, CancelToken, LoadCancelled, build_levels, get_mesh_cache,
+    read_centered_mesh, shallow_copy
+)
+from app.mesh_store import get_mesh_store
+
+# A cancelled load keeps its thread until the STL reader returns, so a
+# second thread lets the next model start right away.
+MAX_THREADS = 2
+
+
+class _Signals(QObject):
+    parsed = pyqtSignal(int, object)
+    loaded = pyqtSignal(int, object)
+    failed = pyqtSignal(int, object)
+    done = pyqtSignal(int)
+
+
+class _LoadTask(QRunnable):
+    def __init__(self, signals, ticket, path, key, budget, token):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = signals
+        self.ticket = ticket
+        self.path = path
+        self.key = key
+        self.budget = budget
+        self.token = token
+
+    def run(self):
+        store = get_mesh_store()
+        try:
+            with tracing.span("MeshLoader.load", "vtk", path=self.path):
+                levels = stored = store.load(self.key)
+                if levels is None:
+                    levels = self.build()
+        except LoadCancelled:
+            pass
+        except Exception as e:
+            self.signals.failed.emit(self.ticket, e)
+        else:
+            get_mesh_cache().put(self.key, levels)
+            self.signals.loaded.emit(self.ticket, levels)
+            # After the model is handed over: saving never delays it.
+            if stored is None:
+                store.save(self.key, levels)
+        finally:
+            self.signals.done.emit(self.ticket)
+
+    def build(self):
+        mesh = read_centered_mesh(self.path, self.token)
+        # Bounds are cached on the shared points array: compute them here,
+        # before the GUI thread starts drawing a copy.
+        mesh.GetBounds()
+        self.signals.parsed.emit(self.ticket, shallow_copy(mesh))
+        with tracing.span("build_levels", "vtk", path=self.path):
+            return build_levels(mesh, self.budget, self.token)
+
+
+class MeshLoader(QObject):
+    # Parses STL files on a thread pool and hands the centered mesh back on
+    # the GUI thread: parsed as soon as the full-detail mesh is ready, then
+    # loaded with all its levels of detail. Models found in the mesh store
+    # skip straight to loaded. Only the latest request matters:
+    # load() cancels the one in flight, whose result is dropped. A cancelled
+    # load that had already built its levels is still cached; one caught
+    # between stages is not.
+    parsed = pyqtSignal(str, object)
+    loaded = pyqtSignal(str, object)
+    failed = pyqtSignal(str, object)
+
+    def __init__(self, parent=None, max_threads=MAX_THREADS):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.loads = 0
+        self.cancelled = 0
+        self._signals = _Signals()
+        self._signals.parsed.connect(self._on_parsed)
+        self._signals.loaded.connect(self._on_loaded)
+        self._signals.failed.connect(self._on_failed)
+        self._signals.done.connect(self._on_done)
+        self._tickets = itertools.count(1)
+        self._current = None
+        # Tasks stay referenced until they report done, cancelled or not:
+        # the pool only holds the C++ side.
+        self._tasks = {}
+
+    def load(self, path, key, budget=LOD_TRIANGLE_BUDGET):
+        self.cancel()
+        task = _LoadTask(self._signals, next(self._tickets), path, key, budget, CancelToken())
+        self._current = task
+        self._tasks[task.ticket] = task
+        self.loads += 1
+        self.pool.start(task)
+
+    def cancel(self):
+        task, self._current = self._current, None
+        if task is None:
+            return
+        task.token.cancel()
+        if self.pool.tryTake(task):
+            del self._tasks[task.ticket]
+        self.cancelled += 1
+
+    def is_loading(self):
+        return self._current is not None
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.waitForDone()
+
+    def _take(self, ticket):
+        task = self._current
+        if task is None or task.ticket != ticket:
+            return None
+        self._current = None
+        return task
+
+    def _on_parsed(self, ticket, mesh):
+        task = self._current
+        if task is not None and task.ticket == ticket:
+            self.parsed.emit(task.path, mesh)
+
+    def _on_loaded(self, ticket, levels):
+        task = self._take(ticket)
+        if task is not None:
+            self.loaded.emit(task.path, levels)
+
+    def _on_failed(self, ticket, error):
+        task = self._take(ticket)
+        if task is not None:
+            self.failed.emit(task.path, error)
+
+    def _on_done(self, ticket):
+        self._tasks.pop(ticket, None)
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from app import tracing
+from app.meshes import polydata_from_arrays, polydata_to_arrays
+
+# Preprocessed models live next to the 3D/ folder, one subdirectory per
+# model and triangle budget.
+MESH_STORE_DIR = '3D_cache'
+# Bumped whenever the preprocessing changes (centering, levels of detail),
+# which invalidates every stored entry.
+MESH_STORE_VERSION = 1
+META_FILE = 'meta.json'
+
+log = logging.getLogger(__name__)
+
+
+class MeshStore:
+    # On-disk cache of build_levels() results, so that the first display of
+    # a model after a restart skips parsing, centering and decimation. Each
+    # level is stored as two .npy files (float points and int32 triangles)
+    # that are memory-mapped back and handed to VTK without a copy. An entry
+    # is valid while the source file keeps the mtime and size recorded in
+    # mesh_key(); anything else (stale, truncated, unreadable) counts as a
+    # miss, and the caller rebuilds and saves it again. Write failures are
+    # logged and otherwise ignored: the store is only ever an optimization.
+
+    def __init__(self, directory=MESH_STORE_DIR):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def entry_path(self, key):
+        path, _, _, budget = key
+        digest = hashlib.sha1(f"{path}\0{budget}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:24])
+
+    @tracing.traced("vtk")
+    def load(self, key):
+        entry = self.entry_path(key)
+        try:
+            with open(os.path.join(entry, META_FILE), encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != MESH_STORE_VERSION or meta.get('key') != list(key):
+                raise LookupError("entrée périmée")
+            levels = []
+            for level, (point_count, triangle_count) in enumerate(meta['levels']):
+                # Copy-on-write: VTK sees writable arrays, the files never
+                # change underneath.
+                points = np.load(os.path.join(entry, f"points{level}.npy"), mmap_mode='c')
+                triangles = np.load(os.path.join(entry, f"triangles{level}.npy"), mmap_mode='c')
+                if (points.shape != (point_count, 3) or triangles.shape != (triangle_count, 3)
+                        or triangles.dtype != np.int32):
+                    raise ValueError("entrée tronquée")
+                levels.append(polydata_from_arrays(points, triangles))
+        except FileNotFoundError:
+            return self._miss()
+        except (OSError, ValueError, LookupError, TypeError) as e:
+            log.info("Entrée du cache de modèles %s ignorée: %s", entry, e)
+            return self._miss()
+        with self._lock:
+            self.hits += 1
+        return tuple(levels)
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return None
+
+    @tracing.traced("vtk")
+    def save(self, key, levels):
+        arrays = [polydata_to_arrays(mesh) for mesh in levels]
+        if any(pair is None for pair in arrays):
+            return False
+        entry = self.entry_path(key)
+        staging = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written aside and renamed into place, so a crash never leaves
+            # a half-written entry behind a valid meta file.
+            staging = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+            for level, (points, triangles) in enumerate(arrays):
+                np.save(os.path.join(staging, f"points{level}.npy"), points)
+                np.save(os.path.join(staging, f"triangles{level}.npy"), triangles)
+            meta = {
+                'version': MESH_STORE_VERSION,
+                'key': list(key),
+                'levels': [[len(points), len(triangles)] for points, triangles in arrays],
+            }
+            with open(os.path.join(staging, META_FILE), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(staging, entry)
+        except OSError as e:
+            log.warning("Impossible d'enregistrer le modèle prétraité de %s: %s", key[0], e)
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+            with self._lock:
+                self.errors += 1
+            return False
+        with self._lock:
+            self.writes += 1
+        return True
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'errors': self.errors,
+            }
+
+
+_mesh_store = MeshStore()
+
+
+def get_mesh_store():
+    return _mesh_store
@@ -0,0 +1,273 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from app import tracing
+from app.stl_reader import read_binary_stl
+
+try:
+    import vtk
+    from vtk.util import numpy_support
+    VTK_AVAILABLE = True
+except ImportError:
+    VTK_AVAILABLE = False
+
+# Memory budget for parsed meshes. A binary STL of n triangles becomes
+# roughly 22 bytes per triangle once parsed (shared points plus int32 cell
+# arrays) and about twice that with its levels of detail, so the defaults
+# hold a dozen million-triangle miniatures.
+MESH_CACHE_BYTES = 512 * 1024 * 1024
+MESH_CACHE_TRIANGLES = 12_000_000
+
+# Levels of detail: a spinning model is drawn from a decimated copy of at
+# most LOD_TRIANGLE_BUDGET triangles, or from coarser copies LOD_REDUCTION
+# times smaller each, down to LOD_MIN_TRIANGLES. Full detail is kept for
+# still frames.
+LOD_TRIANGLE_BUDGET = 250_000
+LOD_REDUCTION = 4
+LOD_MIN_TRIANGLES = 5_000
+# Quadric clustering leaves about this many triangles per bin-sized square
+# of surface.
+CLUSTER_DENSITY = 2.6
+
+
+def mesh_key(path, budget=LOD_TRIANGLE_BUDGET):
+    # Same file, same contents: a re-exported model gets a new mtime or size
+    # and is parsed again. The budget decides which levels get built.
+    stat = os.stat(path)
+    return (os.path.realpath(path), stat.st_mtime_ns, stat.st_size, budget)
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    # Set from another thread to stop a load. Neither STL reader can be
+    # interrupted inside a file, so the load stops at the next stage
+    # boundary and its result is thrown away.
+    __slots__ = ('cancelled',)
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self):
+        if self.cancelled:
+            raise LoadCancelled()
+
+
+def read_centered_mesh(path, token=None):
+    # Parses an STL and moves it so that its bounding box is centered on
+    # the origin, which is what VTKWidget rotates around. Binary files go
+    # through the NumPy reader, ASCII ones through vtkSTLReader. Safe to
+    # run off the GUI thread: both release the GIL while they work.
+    mesh = read_stl_numpy(path)
+    if mesh is None:
+        mesh = read_stl_vtk(path)
+    if token is not None:
+        token.check()
+    return mesh
+
+
+def read_stl_numpy(path):
+    # Centered mesh from a binary STL, or None when vtkSTLReader is needed.
+    with tracing.span("read_binary_stl", "vtk", path=path):
+        arrays = read_binary_stl(path)
+    if arrays is None:
+        return None
+    points, triangles = arrays
+    if len(points):
+        center = (points.min(axis=0).astype(np.float64) + points.max(axis=0)) / 2.0
+        points -= center.astype(np.float32)
+    return polydata_from_arrays(points, triangles)
+
+
+def read_stl_vtk(path):
+    reader = vtk.vtkSTLReader()
+    reader.SetFileName(path)
+    with tracing.span("vtkSTLReader.Update", "vtk", path=path):
+        reader.Update()
+
+    bounds = reader.GetOutput().GetBounds()
+    center_transform = vtk.vtkTransform()
+    center_transform.Translate(-(bounds[0] + bounds[1]) / 2.0,
+                               -(bounds[2] + bounds[3]) / 2.0,
+                               -(bounds[4] + bounds[5]) / 2.0)
+
+    center_filter = vtk.vtkTransformPolyDataFilter()
+    center_filter.SetInputConnection(reader.GetOutputPort())
+    center_filter.SetTransform(center_transform)
+    with tracing.span("center.Update", "vtk"):
+        center_filter.Update()
+    # Detached from the pipeline, so the reader's uncentered copy of the
+    # points is freed with it.
+    return shallow_copy(center_filter.GetOutput())
+
+
+def shallow_copy(mesh):
+    # A new vtkPolyData sharing the arrays of mesh but none of its pipeline
+    # or lazily built cell structures.
+    copy = vtk.vtkPolyData()
+    copy.ShallowCopy(mesh)
+    return copy
+
+
+def decimate(mesh, triangles, area):
+    # vtkQuadricDecimation needs about 10 s per million triangles, far too
+    # slow to run on every new model. vtkQuadricClustering places one vertex
+    # per bin at its quadric error minimum in a single pass; the bin size is
+    # derived from the surface area to land near the requested count.
+    spacing = math.sqrt(CLUSTER_DENSITY * area / triangles)
+    bounds = mesh.GetBounds()
+    clustering = vtk.vtkQuadricClustering()
+    clustering.AutoAdjustNumberOfDivisionsOff()
+    clustering.SetNumberOfDivisions(
+        *(max(1, math.ceil((bounds[2 * i + 1] - bounds[2 * i]) / spacing)) for i in range(3)))
+    clustering.SetInputData(mesh)
+    with tracing.span("vtkQuadricClustering.Update", "vtk", triangles=triangles):
+        clustering.Update()
+    return shallow_copy(clustering.GetOutput())
+
+
+def build_levels(mesh, budget=LOD_TRIANGLE_BUDGET, token=None):
+    # Returns the levels of detail of a centered mesh, finest (the mesh
+    # itself) first. Each level is decimated from the previous one and kept
+    # only if it at least halves the triangle count.
+    levels = [mesh]
+    if mesh.GetNumberOfCells() < 2 * LOD_MIN_TRIANGLES:
+        return tuple(levels)
+    properties = vtk.vtkMassProperties()
+    properties.SetInputData(mesh)
+    properties.Update()
+    area = properties.GetSurfaceArea()
+    target = budget
+    while area > 0 and target >= LOD_MIN_TRIANGLES:
+        if token is not None:
+            token.check()
+        if target * 2 <= levels[-1].GetNumberOfCells():
+            lod = decimate(levels[-1], target, area)
+            if 0 < lod.GetNumberOfCells() * 2 <= levels[-1].GetNumberOfCells():
+                levels.append(lod)
+        target //= LOD_REDUCTION
+    return tuple(levels)
+
+
+def polydata_to_arrays(mesh):
+    # (points, triangles) views of a triangle mesh: float (n, 3) coordinates
+    # and int32 (m, 3) point indices. None if the mesh holds anything else.
+    points = mesh.GetPoints()
+    polys = mesh.GetPolys()
+    if points is None or mesh.GetNumberOfCells() != polys.GetNumberOfCells():
+        return None
+    offsets = numpy_support.vtk_to_numpy(polys.GetOffsetsArray())
+    if not np.array_equal(offsets, np.arange(0, 3 * len(offsets), 3)):
+        return None
+    triangles = numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).reshape(-1, 3)
+    if points.GetNumberOfPoints() >= 2 ** 31:
+        return None
+    return numpy_support.vtk_to_numpy(points.GetData()), triangles.astype(np.int32, copy=False)
+
+
+def polydata_from_arrays(points, triangles):
+    # Wraps the arrays without copying them: the vtkPolyData keeps them
+    # alive, and they must not change afterwards.
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(points, deep=False))
+    offsets = np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int32)
+    polys = vtk.vtkCellArray()
+    polys.SetData(numpy_support.numpy_to_vtk(offsets, deep=False, array_type=vtk.VTK_TYPE_INT32),
+                  numpy_support.numpy_to_vtk(triangles.reshape(-1), deep=False,
+                                             array_type=vtk.VTK_TYPE_INT32))
+    mesh = vtk.vtkPolyData()
+    mesh.SetPoints(vtk_points)
+    mesh.SetPolys(polys)
+    return mesh
+
+
+def mesh_size(levels):
+    return (sum(mesh.GetActualMemorySize() for mesh in levels) * 1024,
+            sum(mesh.GetNumberOfCells() for mesh in levels))
+
+
+class MeshCache:
+    # LRU of centered models keyed by mesh_key(), bounded by total memory
+    # and total triangle count. Each entry is the tuple of build_levels(),
+    # all levels counted. Cached meshes are shared between mappers and must
+    # be treated as read-only. A model larger than the whole budget is not
+    # kept. Filled by app.mesh_loader, the one path that loads models.
+
+    def __init__(self, max_bytes=MESH_CACHE_BYTES, max_triangles=MESH_CACHE_TRIANGLES):
+        self.max_bytes = max_bytes
+        self.max_triangles = max_triangles
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.too_large = 0
+        self.bytes = 0
+        self.triangles = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, levels):
+        size, triangles = mesh_size(levels)
+        with self._lock:
+            # An older version of the same file is dead weight from now on.
+            for stale in [k for k in self._data if k[0] == key[0]]:
+                self._remove(stale)
+            if size > self.max_bytes or triangles > self.max_triangles:
+                self.too_large += 1
+                return
+            self._data[key] = (levels, size, triangles)
+            self.bytes += size
+            self.triangles += triangles
+            while self.bytes > self.max_bytes or self.triangles > self.max_triangles:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, triangles = self._data.pop(key)
+        self.bytes -= size
+        self.triangles -= triangles
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.triangles = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'triangles': self.triangles,
+                'max_triangles': self.max_triangles,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'too_large': self.too_large,
+            }
+
+
+_mesh_cache = MeshCache()
+
+
+def get_mesh_cache():
+    return _mesh_cache
@@ -0,0 +1,80 @@
+import threading
+from PyQt5.QtCore import QThread, pyqtSignal
+
+try:
+    import serial.tools.list_ports
+    SERIAL_AVAILABLE = True
+except ImportError:
+    SERIAL_AVAILABLE = False
+
+# Seconds between two enumerations of the serial ports.
+POLL_INTERVAL = 1.0
+
+
+class PortInfo:
+    # hardware_id identifies the physical adapter across re-plugs, which can
+    # give it another device name (ttyUSB0 -> ttyUSB1, COM3 -> COM5).
+    __slots__ = ('device', 'description', 'hardware_id')
+
+    def __init__(self, device, description, hardware_id):
+        self.device = device
+        self.description = description
+        self.hardware_id = hardware_id
+
+    def __repr__(self):
+        return (f"PortInfo(device={self.device!r}, description={self.description!r}, "
+                f"hardware_id={self.hardware_id!r})")
+
+
+def _hardware_id(port):
+    if port.serial_number:
+        return f"{port.vid}:{port.pid}:{port.serial_number}"
+    if port.vid is not None:
+        return f"{port.vid}:{port.pid}@{port.location}"
+    return None
+
+
+def list_ports():
+    return [PortInfo(port.device, port.description, _hardware_id(port))
+            for port in serial.tools.list_ports.comports()]
+
+
+class PortWatcher(QThread):
+    # Enumerates serial ports in the background and emits the full list
+    # whenever it changes (and once at start), so the GUI thread never calls
+    # comports() itself. scan_now() wakes the thread for an immediate pass.
+    ports_changed = pyqtSignal(object)
+
+    def __init__(self, interval=POLL_INTERVAL, parent=None):
+        super().__init__(parent)
+        self.interval = interval
+        self.scans = 0
+        self.changes = 0
+        self._running = False
+        self._wake = threading.Event()
+
+    def run(self):
+        self._running = True
+        previous = None
+        while self._running:
+            self._wake.clear()
+            try:
+                ports = list_ports()
+            except Exception:
+                ports = None
+            self.scans += 1
+            if ports is not None:
+                signature = sorted((port.device, port.hardware_id) for port in ports)
+                if signature != previous:
+                    previous = signature
+                    self.changes += 1
+                    self.ports_changed.emit(ports)
+            self._wake.wait(self.interval)
+
+    def scan_now(self):
+        self._wake.set()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        self.wait()
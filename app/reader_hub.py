@@ -0,0 +1,294 @@
+import itertools
+import logging
+import random
+import threading
+import time
+from functools import partial
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+from app.badge_key import normalize_badge_id
+from app.latency import get_latency_tracker
+from app import tracing
+from app.serial_reader import ArduinoReaderThread, DEFAULT_BAUDRATE, PROTOCOL_AUTO
+
+SIMULATION_READER = "simulation"
+
+# Delay before the first reconnect attempt, doubled after each failure up
+# to RECONNECT_MAX, with +/-20% jitter so several readers on one hub do not
+# retry in lockstep. Seconds.
+RECONNECT_INITIAL = 0.5
+RECONNECT_MAX = 30.0
+
+log = logging.getLogger(__name__)
+
+
+class Scan:
+    # One badge read, tagged with the reader it came from. seq is assigned
+    # by the hub across all readers and gives the order of the event stream.
+    # received_at is wall-clock time; read_at (bytes off the port),
+    # published_at (hub) and delivered_at (GUI thread) are time.monotonic()
+    # stamps for the latency statistics, None where they do not apply.
+    __slots__ = ('seq', 'reader_id', 'badge_id', 'received_at',
+                 'read_at', 'published_at', 'delivered_at')
+
+    def __init__(self, seq, reader_id, badge_id, received_at, read_at=None,
+                 published_at=None):
+        self.seq = seq
+        self.reader_id = reader_id
+        self.badge_id = badge_id
+        self.received_at = received_at
+        self.read_at = read_at
+        self.published_at = published_at
+        self.delivered_at = None
+
+    def __repr__(self):
+        return (f"Scan(seq={self.seq!r}, reader_id={self.reader_id!r}, "
+                f"badge_id={self.badge_id!r}, received_at={self.received_at!r})")
+
+
+class _Reader:
+    def __init__(self, reader_id, port=None, baudrate=DEFAULT_BAUDRATE, protocol=PROTOCOL_AUTO):
+        self.reader_id = reader_id
+        self.port = port
+        self.baudrate = baudrate
+        self.protocol = protocol
+        self.hardware_id = None
+        self.thread = None
+        self.retry_timer = None
+        self.lost_at = None
+        self.attempts = 0
+        self.reconnects = 0
+        self.reconnect_latency = None
+        self.connected = False
+        self.message = ""
+        self.scans = 0
+        self.session_scans = 0
+        self.connected_at = None
+        self.last_scan_at = None
+        self.connects = 0
+        self.errors = 0
+
+    def stats(self, now):
+        elapsed = now - self.connected_at if self.connected else 0
+        decoder = self.thread.decoder.stats() if self.thread is not None else {}
+        return {
+            'port': self.port,
+            'connected': self.connected,
+            'message': self.message,
+            'scans': self.scans,
+            'scans_per_minute': self.session_scans * 60 / elapsed if elapsed > 0 else 0.0,
+            'last_scan_at': self.last_scan_at,
+            'connects': self.connects,
+            'errors': self.errors,
+            'protocol': decoder.get('protocol'),
+            'bad_frames': decoder.get('bad_frames', 0),
+            'reconnecting': self.lost_at is not None,
+            'reconnects': self.reconnects,
+            'last_reconnect_latency': self.reconnect_latency,
+        }
+
+
+class ReaderHub(QObject):
+    # Owns one ArduinoReaderThread per serial port and merges their output
+    # into a single stream of Scan objects on the GUI thread. Lines are
+    # stamped and numbered in the reader thread, under one lock, and then
+    # queued to the GUI thread, so scan_received fires in seq order whatever
+    # the number of readers. Simulated scans go through the same path, and
+    # every badge ID leaves the hub in canonical form.
+    # A board running several RC522 modules over the framed protocol shows
+    # up as one reader per module, "<reader_id>#<n>" for module n > 0.
+    #
+    # A reader that loses its connection after having been connected stays
+    # registered and is retried with exponential backoff, or at once when
+    # set_ports() (fed by PortWatcher) reports its port, or its adapter
+    # under a new device name, as present again. Opening the port happens
+    # in the reader thread, so none of this blocks the GUI thread.
+    scan_received = pyqtSignal(object)
+    reader_status = pyqtSignal(str, bool, str)
+    _deliver = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._readers = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._ports = None
+        self._deliver.connect(self.scan_received, Qt.QueuedConnection)
+
+    def connect_reader(self, port, reader_id=None, baudrate=DEFAULT_BAUDRATE,
+                       protocol=PROTOCOL_AUTO):
+        reader_id = reader_id or port
+        reader = self._readers.get(reader_id)
+        if reader is None:
+            reader = self._readers[reader_id] = _Reader(reader_id, port, baudrate, protocol)
+        elif reader.thread is not None and reader.thread.isRunning():
+            return reader_id
+        reader.port = port
+        reader.baudrate = baudrate
+        reader.protocol = protocol
+        self._start(reader)
+        return reader_id
+
+    def _start(self, reader):
+        if reader.thread is not None:
+            # A failed thread emits its status just before it ends.
+            reader.thread.wait()
+        thread = ArduinoReaderThread(reader.port, reader.baudrate, reader.protocol)
+        # The scan slot runs in the reader thread itself; see _publish.
+        thread.badge_scanned.connect(partial(self._publish, reader), Qt.DirectConnection)
+        thread.connection_status.connect(partial(self._on_status, reader, thread))
+        reader.thread = thread
+        thread.start()
+
+    def disconnect_reader(self, reader_id):
+        reader = self._readers.pop(reader_id, None)
+        if reader is None:
+            return
+        if reader.retry_timer is not None:
+            reader.retry_timer.stop()
+        if reader.thread is not None:
+            reader.thread.stop()
+            reader.thread = None
+        if reader.port is not None:
+            reader.connected = False
+            self.reader_status.emit(reader_id, False, "Déconnecté")
+
+    def disconnect_all(self):
+        for reader_id in list(self._readers):
+            self.disconnect_reader(reader_id)
+
+    def inject(self, badge_id, reader_id=SIMULATION_READER):
+        reader = self._readers.get(reader_id)
+        if reader is None:
+            reader = self._readers[reader_id] = _Reader(reader_id)
+        self._publish(reader, 0, badge_id)
+
+    def reader_ids(self):
+        return list(self._readers)
+
+    def reader_for_port(self, port):
+        for reader in self._readers.values():
+            if reader.port == port:
+                return reader.reader_id
+        return None
+
+    def is_connected(self, reader_id):
+        reader = self._readers.get(reader_id)
+        return reader is not None and reader.connected
+
+    def set_ports(self, ports):
+        # ports: list of PortInfo currently present on the machine.
+        self._ports = {port.device: port for port in ports}
+        by_hardware = {port.hardware_id: port.device for port in ports if port.hardware_id}
+        for reader in list(self._readers.values()):
+            if reader.port is None:
+                continue
+            present = self._ports.get(reader.port)
+            if present is not None and present.hardware_id:
+                reader.hardware_id = present.hardware_id
+            if reader.lost_at is None:
+                if reader.connected and present is None:
+                    # Unplugged: the blocked read may not notice on every
+                    # platform, so stop the thread rather than wait for it.
+                    reader.thread.stop()
+                    self._lost(reader, "Port retiré")
+                continue
+            if present is None and reader.hardware_id in by_hardware:
+                log.info("Lecteur %s: %s réapparu sous %s", reader.reader_id,
+                         reader.port, by_hardware[reader.hardware_id])
+                reader.port = by_hardware[reader.hardware_id]
+                present = self._ports[reader.port]
+            if present is not None and not reader.thread.isRunning():
+                self._retry(reader.reader_id)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {reader_id: reader.stats(now) for reader_id, reader in self._readers.items()}
+
+    def _publish(self, reader, module, badge_id):
+        reader_id = f"{reader.reader_id}#{module}" if module else reader.reader_id
+        badge_id = normalize_badge_id(badge_id)
+        published_at = time.monotonic()
+        # Runs in the reader thread right after the chunk was decoded.
+        read_at = reader.thread.decoder.last_data_at if reader.thread is not None else None
+        if read_at is not None:
+            get_latency_tracker().record('serial', published_at - read_at)
+        else:
+            read_at = published_at
+        with self._lock:
+            scan = Scan(next(self._seq), reader_id, badge_id, time.time(), read_at, published_at)
+            tracing.instant("scan", "serial", seq=scan.seq, reader=reader_id, badge=badge_id)
+            reader.scans += 1
+            reader.session_scans += 1
+            reader.last_scan_at = scan.received_at
+            # Emitting while holding the lock keeps the queued events in
+            # seq order across reader threads.
+            self._deliver.emit(scan)
+
+    def _on_status(self, reader, thread, connected, message):
+        tracing.instant("reader_status", "serial", reader=reader.reader_id,
+                        connected=connected, message=message)
+        if reader.thread is not thread or self._readers.get(reader.reader_id) is not reader:
+            # Late status from a replaced thread or a removed reader.
+            return
+        if not connected:
+            reader.errors += 1
+            if reader.connects == 0:
+                # Never connected: a wrong port or baud rate, not a reader
+                # to keep retrying.
+                self._readers.pop(reader.reader_id, None)
+                self.reader_status.emit(reader.reader_id, False, message)
+            elif reader.lost_at is None:
+                self._lost(reader, message)
+            else:
+                self._schedule_retry(reader, message)
+            return
+        now = time.monotonic()
+        with self._lock:
+            reader.connects += 1
+            reader.session_scans = 0
+            reader.connected_at = now
+            reader.connected = True
+            reader.message = message
+        if self._ports and reader.port in self._ports:
+            reader.hardware_id = self._ports[reader.port].hardware_id or reader.hardware_id
+        if reader.lost_at is not None:
+            reader.reconnect_latency = now - reader.lost_at
+            reader.reconnects += 1
+            log.info("Lecteur %s reconnecté sur %s en %.2f s (%d tentatives)",
+                     reader.reader_id, reader.port, reader.reconnect_latency, reader.attempts)
+            reader.lost_at = None
+            reader.attempts = 0
+        self.reader_status.emit(reader.reader_id, True, message)
+
+    def _lost(self, reader, message):
+        with self._lock:
+            reader.connected = False
+        reader.lost_at = time.monotonic()
+        reader.attempts = 0
+        log.warning("Lecteur %s perdu sur %s: %s", reader.reader_id, reader.port, message)
+        self._schedule_retry(reader, message)
+
+    def _schedule_retry(self, reader, message):
+        delay = min(RECONNECT_MAX, RECONNECT_INITIAL * 2 ** reader.attempts)
+        delay *= random.uniform(0.8, 1.2)
+        if reader.retry_timer is None:
+            reader.retry_timer = QTimer(self)
+            reader.retry_timer.setSingleShot(True)
+            reader.retry_timer.timeout.connect(partial(self._retry, reader.reader_id))
+        reader.retry_timer.start(int(delay * 1000))
+        reader.message = f"{message} — nouvelle tentative dans {delay:.1f} s"
+        self.reader_status.emit(reader.reader_id, False, reader.message)
+
+    def _retry(self, reader_id):
+        reader = self._readers.get(reader_id)
+        if reader is None or reader.connected or reader.lost_at is None:
+            return
+        reader.retry_timer.stop()
+        if self._ports is not None and reader.port not in self._ports:
+            # Known to be unplugged: set_ports() retries once it is back.
+            reader.message = f"En attente de {reader.port}"
+            self.reader_status.emit(reader_id, False, reader.message)
+            return
+        reader.attempts += 1
+        self._start(reader)
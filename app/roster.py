@@ -0,0 +1,70 @@
+# Bulk roster import/export from the command line:
+#
+#   python -m app.roster import roster.csv
+#   python -m app.roster export roster.jsonl --db rfid_data.db
+#
+# The format follows the file extension (.csv, .jsonl) unless --format is
+# given. Imports upsert on badge_id in a single transaction.
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from app import database as db
+
+FORMATS = ("csv", "jsonl")
+
+
+def detect_format(path, forced=None):
+    if forced:
+        return forced
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    raise SystemExit(f"Format inconnu pour {path}, précisez --format {'/'.join(FORMATS)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.roster",
+                                     description="Import/export du roster de personnages")
+    parser.add_argument("--db", default=db.DB_PATH, help="base SQLite (défaut: %(default)s)")
+    # --db is also accepted after the subcommand; SUPPRESS keeps the
+    # subparser from overwriting a value given before it.
+    db_option = argparse.ArgumentParser(add_help=False)
+    db_option.add_argument("--db", default=argparse.SUPPRESS, help="base SQLite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("import", "export"):
+        command = sub.add_parser(name, parents=[db_option])
+        command.add_argument("path")
+        command.add_argument("--format", choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    db.DB_PATH = args.db
+    fmt = detect_format(args.path, args.format)
+    start = time.perf_counter()
+    try:
+        db.init_database()
+        if args.command == "import":
+            future = db.import_csv(args.path) if fmt == "csv" else db.import_jsonl(args.path)
+            count = future.result()
+            verb = "importés"
+        else:
+            count = db.export_csv(args.path) if fmt == "csv" else db.export_jsonl(args.path)
+            verb = "exportés"
+    except (db.RosterError, OSError) as e:
+        print(f"Erreur: {e}", file=sys.stderr)
+        return 1
+    except sqlite3.Error as e:
+        print(f"Erreur de base de données: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_all_connections()
+    elapsed = time.perf_counter() - start
+    print(f"{count} personnages {verb} en {elapsed:.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import time
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+ACCEPT = "accept"
+DUPLICATE = "duplicate"
+PRESENT = "present"
+
+
+class DedupConfig:
+    # window: a badge re-read by the same reader less than this many
+    # seconds after it was last displayed is dropped, as long as it is
+    # still the badge on screen.
+    # presence_gap: reads of the same badge closer together than this are
+    # taken as the card still lying on the reader, however long it stays.
+    # coalesce: after a display, further badges from the same reader within
+    # this many seconds are held and only the last one is shown.
+    # All in seconds; 0 disables the stage.
+    __slots__ = ('window', 'presence_gap', 'coalesce')
+
+    def __init__(self, window=2.0, presence_gap=1.0, coalesce=0.3):
+        self.window = window
+        self.presence_gap = presence_gap
+        self.coalesce = coalesce
+
+    def __repr__(self):
+        return (f"DedupConfig(window={self.window!r}, presence_gap={self.presence_gap!r}, "
+                f"coalesce={self.coalesce!r})")
+
+
+PASS_THROUGH = DedupConfig(0, 0, 0)
+
+
+class _ReaderState:
+    __slots__ = ('badge_id', 'last_seen', 'accepted_at', 'counters')
+
+    def __init__(self):
+        self.badge_id = None
+        self.last_seen = 0.0
+        self.accepted_at = 0.0
+        self.counters = {ACCEPT: 0, DUPLICATE: 0, PRESENT: 0, 'coalesced': 0}
+
+
+class ScanDeduplicator:
+    # Per-reader suppression of repeated reads. offer() is pure bookkeeping
+    # on the timestamps it is given, so it can be driven from a recorded
+    # trace as well as from live scans. Timestamps must come from a
+    # monotonic clock.
+    #
+    # All readers drive one display, so a repeat within the window is only
+    # dropped while its badge is still the one on screen: once another
+    # reader has shown a different badge, tapping the first one again
+    # brings it back. A card left lying on its reader (presence_gap) stays
+    # suppressed either way, or it would keep taking the screen back.
+
+    def __init__(self, default=None):
+        self.default = default or DedupConfig()
+        self._configs = {}
+        self._states = {}
+        self.on_screen = None
+
+    def configure(self, reader_id, config):
+        self._configs[reader_id] = config
+
+    def config_for(self, reader_id):
+        return self._configs.get(reader_id, self.default)
+
+    def offer(self, reader_id, badge_id, now):
+        config = self.config_for(reader_id)
+        state = self._states.get(reader_id)
+        if state is None:
+            state = self._states[reader_id] = _ReaderState()
+        verdict = ACCEPT
+        if badge_id == state.badge_id:
+            gap = now - state.last_seen
+            if gap < config.presence_gap:
+                verdict = PRESENT
+            elif now - state.accepted_at < config.window and badge_id == self.on_screen:
+                verdict = DUPLICATE
+        state.badge_id = badge_id
+        state.last_seen = now
+        if verdict == ACCEPT:
+            state.accepted_at = now
+            self.on_screen = badge_id
+        state.counters[verdict] += 1
+        return verdict
+
+    def shown(self, badge_id):
+        # The badge actually displayed, when something (coalescing) sits
+        # between acceptance and display.
+        self.on_screen = badge_id
+
+    def count_coalesced(self, reader_id):
+        self._states[reader_id].counters['coalesced'] += 1
+
+    def reset(self, reader_id=None):
+        if reader_id is None:
+            self._states.clear()
+            self.on_screen = None
+        else:
+            self._states.pop(reader_id, None)
+
+    def stats(self):
+        readers = {}
+        for reader_id, state in self._states.items():
+            counters = state.counters
+            avoided = counters[DUPLICATE] + counters[PRESENT] + counters['coalesced']
+            readers[reader_id] = {
+                'received': counters[ACCEPT] + counters[DUPLICATE] + counters[PRESENT],
+                'displayed': counters[ACCEPT] - counters['coalesced'],
+                'suppressed_window': counters[DUPLICATE],
+                'suppressed_present': counters[PRESENT],
+                'coalesced': counters['coalesced'],
+                'refreshes_avoided': avoided,
+            }
+        totals = {}
+        for counters in readers.values():
+            for key, value in counters.items():
+                totals[key] = totals.get(key, 0) + value
+        return {'readers': readers, 'totals': totals}
+
+
+def scan_time(scan):
+    # received_at is wall-clock time and jumps with the system clock; the
+    # windows are measured on the monotonic stamps instead.
+    if scan.read_at is not None:
+        return scan.read_at
+    if scan.published_at is not None:
+        return scan.published_at
+    return time.monotonic()
+
+
+class ScanFilter(QObject):
+    # Sits between ReaderHub.scan_received and the display. Scans that pass
+    # the deduplicator are shown at once; scans arriving from the same
+    # reader during the following coalesce window are held, and only the
+    # last one is shown when the window closes.
+    scan_accepted = pyqtSignal(object)
+
+    def __init__(self, default=None, parent=None):
+        super().__init__(parent)
+        self.dedup = ScanDeduplicator(default)
+        self._timers = {}
+        self._held = {}
+
+    def configure(self, reader_id, config):
+        self.dedup.configure(reader_id, config)
+
+    def offer(self, scan):
+        verdict = self.dedup.offer(scan.reader_id, scan.badge_id, scan_time(scan))
+        if verdict != ACCEPT:
+            return verdict
+        timer = self._timers.get(scan.reader_id)
+        if timer is not None and timer.isActive():
+            if scan.reader_id in self._held:
+                self.dedup.count_coalesced(scan.reader_id)
+            self._held[scan.reader_id] = scan
+        else:
+            self._emit(scan)
+        return verdict
+
+    def reset(self, reader_id):
+        timer = self._timers.pop(reader_id, None)
+        if timer is not None:
+            timer.stop()
+        self._held.pop(reader_id, None)
+        self.dedup.reset(reader_id)
+
+    def stats(self):
+        return self.dedup.stats()
+
+    def _emit(self, scan):
+        coalesce = self.dedup.config_for(scan.reader_id).coalesce
+        if coalesce > 0:
+            timer = self._timers.get(scan.reader_id)
+            if timer is None:
+                timer = self._timers[scan.reader_id] = QTimer(self)
+                timer.setSingleShot(True)
+                timer.timeout.connect(lambda reader_id=scan.reader_id: self._release(reader_id))
+            timer.start(int(coalesce * 1000))
+        self.dedup.shown(scan.badge_id)
+        self.scan_accepted.emit(scan)
+
+    def _release(self, reader_id):
+        scan = self._held.pop(reader_id, None)
+        if scan is not None:
+            self._emit(scan)
@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from app import database as db
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 0.5
+MAX_PENDING = 50000
+
+
+class ScanLogger:
+    # Write-behind queue for scan events. log() only enqueues, so the GUI and
+    # serial threads never wait on SQLite; a background thread commits the
+    # queue in batches once BATCH_SIZE events are pending or FLUSH_INTERVAL
+    # seconds after the first pending event, whichever comes first. Batches
+    # are handed to the database writer thread as a single operation.
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logged = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="scan-log", daemon=True)
+        self._thread.start()
+
+    def log(self, badge_id, reader_id, scanned_at=None):
+        if scanned_at is None:
+            scanned_at = time.time()
+        try:
+            self._queue.put_nowait((badge_id, reader_id, scanned_at))
+            self.logged += 1
+        except queue.Full:
+            # A stuck disk must not back up into the scan path.
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        # Block until everything logged so far has been written.
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._running = False
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def stats(self):
+        return {
+            'logged': self.logged,
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'pending': self._queue.qsize(),
+        }
+
+    def _run(self):
+        while self._running or not self._queue.empty():
+            item = self._queue.get()
+            batch = []
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                # Drain whatever was queued before stop() was called.
+                rest = []
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if isinstance(item, tuple):
+                        rest.append(item)
+                    elif isinstance(item, threading.Event):
+                        item.set()
+                self._write(rest)
+                break
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            db.insert_scan_events(batch).result()
+            self.written += len(batch)
+            self.batches += 1
+        except Exception:
+            self.errors += len(batch)
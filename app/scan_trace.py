@@ -0,0 +1,377 @@
+# Scan traces: record the scan stream of a session and replay it.
+#
+# A trace is a JSONL file, a header line then one line per scan with its
+# offset in seconds from the first scan:
+#
+#   {"format": "jdr-scan-trace", "version": 1, "started_at": 1718000000.0}
+#   {"t": 0.0, "reader": "COM3", "badge": "0a:1b:2c:3d"}
+#
+# Replay drives the same reader path as a game night, either through one
+# virtual serial port (pty) per recorded reader, read by real
+# ArduinoReaderThreads, or by injecting scans straight into a ReaderHub:
+#
+#   python -m app.scan_trace replay soiree.jsonl --speed 20 --via pty
+#   python -m app.scan_trace replay soiree.jsonl --speed 0 --db rfid_data.db
+#   python -m app.scan_trace generate charge.jsonl --readers 6 --scans 5000
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+TRACE_FORMAT = "jdr-scan-trace"
+TRACE_VERSION = 1
+
+# A scan delivered more than this long after its scheduled time is late.
+LATE_THRESHOLD = 0.1
+# How long replay waits for stragglers after the last scan was sent.
+DRAIN_TIMEOUT = 2.0
+
+
+class TraceEvent:
+    __slots__ = ('t', 'reader_id', 'badge_id')
+
+    def __init__(self, t, reader_id, badge_id):
+        self.t = t
+        self.reader_id = reader_id
+        self.badge_id = badge_id
+
+    def __repr__(self):
+        return f"TraceEvent(t={self.t!r}, reader_id={self.reader_id!r}, badge_id={self.badge_id!r})"
+
+
+class ScanRecorder:
+    # Appends every Scan from ReaderHub.scan_received to a trace file.
+    # Offsets come from Scan.received_at, stamped in the reader thread, so
+    # GUI thread stalls do not distort the recorded timing.
+
+    def __init__(self, path):
+        self.path = path
+        self.recorded = 0
+        self._file = open(path, "w", encoding="utf-8")
+        self._start = None
+
+    def record(self, scan):
+        if self._start is None:
+            self._start = scan.received_at
+            self._file.write(json.dumps({"format": TRACE_FORMAT, "version": TRACE_VERSION,
+                                         "started_at": scan.received_at}) + "\n")
+        self._file.write(json.dumps({"t": round(scan.received_at - self._start, 6),
+                                     "reader": scan.reader_id, "badge": scan.badge_id}) + "\n")
+        self.recorded += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_trace(path):
+    events = []
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != TRACE_FORMAT:
+            raise ValueError(f"{path}: pas une trace de scans")
+        if header.get("version", 0) > TRACE_VERSION:
+            raise ValueError(f"{path}: version de trace {header['version']} non gérée")
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                events.append(TraceEvent(float(record["t"]), record["reader"], record["badge"]))
+    events.sort(key=lambda event: event.t)
+    return events
+
+
+def write_trace(path, events, started_at=None):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"format": TRACE_FORMAT, "version": TRACE_VERSION,
+                            "started_at": started_at or time.time()}) + "\n")
+        for event in events:
+            f.write(json.dumps({"t": round(event.t, 6), "reader": event.reader_id,
+                                "badge": event.badge_id}) + "\n")
+
+
+def generate_trace(readers=4, scans=1000, duration=3600.0, players=None, repeat=0.3, seed=0):
+    # Synthetic game night: taps spread over the session, each reader seeing
+    # a few players' badges, and a share of taps where the card is left on
+    # the reader and re-read a few times (what the sketch does).
+    rng = random.Random(seed)
+    players = players or readers * 3
+    badges = [bytes(rng.randrange(256) for _ in range(4)).hex(':') for _ in range(players)]
+    reader_ids = [f"lecteur{n + 1}" for n in range(readers)]
+    events = []
+    while len(events) < scans:
+        t = rng.uniform(0, duration)
+        reader_id = rng.choice(reader_ids)
+        badge_id = rng.choice(badges)
+        events.append(TraceEvent(t, reader_id, badge_id))
+        if rng.random() < repeat:
+            for n in range(rng.randrange(1, 6)):
+                events.append(TraceEvent(t + 0.25 * (n + 1), reader_id, badge_id))
+    events.sort(key=lambda event: event.t)
+    return events[:scans]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class _PtyLink:
+    # One pty pair per recorded reader; the hub reads the slave side through
+    # an ordinary ArduinoReaderThread, the replay writes to the master side.
+
+    def __init__(self, hub, reader_ids, protocol):
+        from app.serial_reader import PROTOCOL_FRAMED, encode_frame
+        from app.badge_key import parse_uid
+        self._masters = {}
+        self._slaves = []
+        self._framed = protocol == PROTOCOL_FRAMED
+        self._encode_frame = encode_frame
+        self._parse_uid = parse_uid
+        for reader_id in reader_ids:
+            master, slave = os.openpty()
+            self._masters[reader_id] = master
+            self._slaves.append(slave)
+            hub.connect_reader(os.ttyname(slave), reader_id=reader_id)
+
+    def send(self, event):
+        uid = self._parse_uid(event.badge_id) if self._framed else None
+        if uid is not None:
+            data = self._encode_frame(uid)
+        else:
+            data = event.badge_id.encode() + b"\r\n"
+        os.write(self._masters[event.reader_id], data)
+
+    def close(self):
+        for fd in (*self._masters.values(), *self._slaves):
+            os.close(fd)
+
+
+class ReplayHarness:
+    # Replays a trace at `speed` times real time (0 = as fast as possible)
+    # and measures, for each scan, the delay between its scheduled send time
+    # and its arrival on ReaderHub.scan_received in the Qt event loop. Extra
+    # work per scan (deduplication, database lookup...) goes in on_scan so
+    # it loads the event loop as the application would.
+
+    def __init__(self, events, speed=1.0, via="pipeline", protocol="text",
+                 late_threshold=LATE_THRESHOLD, on_scan=None):
+        self.events = events
+        self.speed = speed
+        self.via = via
+        self.protocol = protocol
+        self.late_threshold = late_threshold
+        self.on_scan = on_scan
+
+    def run(self):
+        from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+        from app.reader_hub import ReaderHub
+        app = QCoreApplication.instance() or QCoreApplication([])
+        hub = ReaderHub()
+        reader_ids = sorted({event.reader_id for event in self.events})
+        pending = {reader_id: deque() for reader_id in reader_ids}
+        latencies = []
+        late = []
+        unexpected = [0]
+        done = threading.Event()
+        loop = QEventLoop()
+
+        def on_received(scan):
+            now = time.monotonic()
+            queue = pending.get(scan.reader_id)
+            if not queue:
+                unexpected[0] += 1
+            else:
+                delay = now - queue.popleft()
+                latencies.append(delay)
+                if delay > self.late_threshold:
+                    late.append(delay)
+            if self.on_scan is not None:
+                self.on_scan(scan)
+
+        hub.scan_received.connect(on_received)
+
+        link = None
+        if self.via == "pty":
+            link = _PtyLink(hub, reader_ids, self.protocol)
+            ready = time.monotonic() + 5
+            while not all(hub.is_connected(reader_id) for reader_id in reader_ids):
+                app.processEvents(QEventLoop.AllEvents, 50)
+                if time.monotonic() > ready:
+                    raise RuntimeError("Les ports virtuels ne se sont pas connectés")
+            send = link.send
+        else:
+            def send(event):
+                hub.inject(event.badge_id, event.reader_id)
+
+        def feed():
+            # Send times are recorded before the write so the measured delay
+            # covers the whole path, reader thread included.
+            start = time.monotonic()
+            for event in self.events:
+                if self.speed > 0:
+                    delay = start + event.t / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                pending[event.reader_id].append(time.monotonic())
+                send(event)
+            done.set()
+
+        sender = threading.Thread(target=feed, name="scan-replay", daemon=True)
+        started = time.monotonic()
+        sender.start()
+
+        deadline = [None]
+
+        def check():
+            if not done.is_set():
+                return
+            if deadline[0] is None:
+                deadline[0] = time.monotonic() + DRAIN_TIMEOUT
+            if len(latencies) >= len(self.events) or time.monotonic() > deadline[0]:
+                loop.quit()
+
+        timer = QTimer()
+        timer.timeout.connect(check)
+        timer.start(20)
+        loop.exec_()
+        timer.stop()
+        elapsed = time.monotonic() - started
+        sender.join()
+        hub.disconnect_all()
+        if link is not None:
+            link.close()
+
+        latencies.sort()
+        received = len(latencies)
+        trace_span = self.events[-1].t - self.events[0].t if self.events else 0.0
+        return {
+            'via': self.via,
+            'speed': self.speed,
+            'sent': len(self.events),
+            'received': received,
+            'dropped': len(self.events) - received,
+            'unexpected': unexpected[0],
+            'late': len(late),
+            'late_threshold_ms': self.late_threshold * 1000,
+            'elapsed_s': elapsed,
+            'trace_span_s': trace_span,
+            'throughput_per_s': received / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': {
+                'p50': _ms(percentile(latencies, 50)),
+                'p95': _ms(percentile(latencies, 95)),
+                'p99': _ms(percentile(latencies, 99)),
+                'max': _ms(latencies[-1] if latencies else None),
+            },
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def _pipeline(db_path):
+    # The display path of MainApplication without the windows: scan log,
+    # deduplication, then the badge lookup for every scan that gets through.
+    from app import database as db
+    from app.latency import get_latency_tracker
+    from app.scan_filter import ScanFilter
+    from app.scan_log import ScanLogger
+    db.DB_PATH = db_path
+    db.init_database()
+    logger = ScanLogger()
+    logger.start()
+    scan_filter = ScanFilter()
+    latency = get_latency_tracker()
+    latency.reset()
+    lookups = [0]
+
+    def lookup(scan):
+        latency.begin(scan)
+        db.get_character_by_badge(scan.badge_id)
+        latency.finish('lookup')
+        lookups[0] += 1
+    scan_filter.scan_accepted.connect(lookup)
+
+    def on_scan(scan):
+        latency.delivered(scan)
+        logger.log(scan.badge_id, scan.reader_id, scan.received_at)
+        scan_filter.offer(scan)
+
+    def finish():
+        logger.stop()
+        db.close_all_connections()
+        return {'lookups': lookups[0], 'filter': scan_filter.stats()['totals'],
+                'scan_log': logger.stats(),
+                'latency': {name: summary for name, summary in latency.stats().items()
+                            if summary['count']}}
+    return on_scan, finish
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.scan_trace",
+                                     description="Enregistrement et rejeu de traces de scans")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay = commands.add_parser("replay", help="rejouer une trace")
+    replay.add_argument("path")
+    replay.add_argument("--speed", type=float, default=1.0,
+                        help="multiplicateur de vitesse, 0 = aussi vite que possible")
+    replay.add_argument("--via", choices=("pipeline", "pty"), default="pipeline")
+    replay.add_argument("--protocol", choices=("text", "framed"), default="text",
+                        help="protocole écrit sur les ports virtuels (--via pty)")
+    replay.add_argument("--db", help="base à utiliser pour le journal et les recherches de badge")
+    replay.add_argument("--late-ms", type=float, default=LATE_THRESHOLD * 1000)
+
+    generate = commands.add_parser("generate", help="générer une trace synthétique")
+    generate.add_argument("path")
+    generate.add_argument("--readers", type=int, default=4)
+    generate.add_argument("--scans", type=int, default=1000)
+    generate.add_argument("--duration", type=float, default=3600.0, help="secondes")
+    generate.add_argument("--seed", type=int, default=0)
+
+    info = commands.add_parser("info", help="résumer une trace")
+    info.add_argument("path")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        events = generate_trace(args.readers, args.scans, args.duration, seed=args.seed)
+        write_trace(args.path, events)
+        print(f"{len(events)} scans écrits dans {args.path}")
+        return 0
+
+    events = read_trace(args.path)
+    if args.command == "info":
+        readers = {}
+        for event in events:
+            readers[event.reader_id] = readers.get(event.reader_id, 0) + 1
+        span = events[-1].t - events[0].t if events else 0.0
+        print(f"{len(events)} scans sur {span:.1f} s, "
+              f"{len({event.badge_id for event in events})} badges")
+        for reader_id, count in sorted(readers.items()):
+            print(f"  {reader_id}: {count}")
+        return 0
+
+    on_scan = finish = None
+    if args.db:
+        on_scan, finish = _pipeline(args.db)
+    harness = ReplayHarness(events, args.speed, args.via, args.protocol,
+                            args.late_ms / 1000, on_scan)
+    report = harness.run()
+    if finish is not None:
+        report['pipeline'] = finish()
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 1 if report['dropped'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import re
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+from app.badge_key import format_uid
+
+try:
+    import serial
+    SERIAL_AVAILABLE = True
+except ImportError:
+    SERIAL_AVAILABLE = False
+
+DEFAULT_BAUDRATE = 115200
+BAUDRATES = (9600, 57600, 115200, 230400, 250000, 500000)
+
+# Upper bound on how long a blocked read waits before re-checking the stop
+# flag. Data is returned as soon as it arrives, so this adds no scan latency;
+# stop() also cancels the pending read where pyserial supports it.
+READ_TIMEOUT = 0.5
+
+# Bytes kept while waiting for a newline; anything longer is line noise.
+MAX_LINE_LENGTH = 256
+
+# Framed protocol, as sent by the sketch with FRAMED_PROTOCOL set:
+#
+#   0xA5 | length | reader | uid[length] | crc8(length, reader, uid)
+#
+# length is the UID size (4, 7 or 10 bytes for MIFARE cards), reader lets
+# one board with several RC522 modules tell them apart.
+PROTOCOL_AUTO = "auto"
+PROTOCOL_TEXT = "text"
+PROTOCOL_FRAMED = "framed"
+
+FRAME_START = 0xA5
+MAX_UID_LENGTH = 10
+FRAME_OVERHEAD = 4
+
+# A line that can be taken as a badge before the protocol is known.
+TEXT_BADGE = re.compile(r'[0-9A-Za-z:_\-]{1,64}')
+
+
+def _crc8_table(poly=0x07):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+_CRC8 = _crc8_table()
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc = _CRC8[crc ^ byte]
+    return crc
+
+
+def encode_frame(uid, reader=0):
+    body = bytes((len(uid), reader)) + bytes(uid)
+    return bytes((FRAME_START,)) + body + bytes((crc8(body),))
+
+
+class LineBuffer:
+    # Splits an arbitrary byte stream into stripped text lines.
+
+    def __init__(self, max_length=MAX_LINE_LENGTH):
+        self.max_length = max_length
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer += data
+        lines = []
+        while True:
+            end = self._buffer.find(b'\n')
+            if end < 0:
+                break
+            line = self._buffer[:end].decode('utf-8', errors='ignore').strip()
+            del self._buffer[:end + 1]
+            if line:
+                lines.append(line)
+        if len(self._buffer) > self.max_length:
+            self._buffer.clear()
+        return lines
+
+
+class FrameParser:
+    # Incremental parser for the framed protocol. Bytes that cannot start a
+    # valid frame are skipped one at a time, so after noise or a truncated
+    # frame the parser locks back on at the next start byte whose length
+    # and checksum check out.
+
+    def __init__(self):
+        self.frames = 0
+        self.bad_frames = 0
+        self.noise_bytes = 0
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        buffer = self._buffer
+        buffer += data
+        size = len(buffer)
+        frames = []
+        pos = 0
+        while True:
+            start = buffer.find(FRAME_START, pos)
+            if start < 0:
+                self.noise_bytes += size - pos
+                pos = size
+                break
+            self.noise_bytes += start - pos
+            pos = start
+            if size - pos < 2:
+                break
+            length = buffer[pos + 1]
+            if not 1 <= length <= MAX_UID_LENGTH:
+                self.bad_frames += 1
+                self.noise_bytes += 1
+                pos += 1
+                continue
+            end = pos + length + FRAME_OVERHEAD
+            if end > size:
+                break
+            if crc8(buffer[pos + 1:end - 1]) != buffer[end - 1]:
+                self.bad_frames += 1
+                self.noise_bytes += 1
+                pos += 1
+                continue
+            frames.append((buffer[pos + 2], bytes(buffer[pos + 3:end - 1])))
+            self.frames += 1
+            pos = end
+        del buffer[:pos]
+        return frames
+
+
+class SerialDecoder:
+    # Turns raw serial bytes into (reader, badge_id) pairs. In auto mode
+    # both parsers see the stream until one of them produces something: a
+    # valid frame selects the framed protocol, a badge-looking text line
+    # selects the text protocol of the original sketch. A frame header
+    # holds a control byte (its length), so frames never pass as text.
+
+    def __init__(self, protocol=PROTOCOL_AUTO):
+        self.protocol = protocol
+        self.frames = FrameParser()
+        self.lines = LineBuffer()
+        # Monotonic time of the last chunk, the start of a scan's latency.
+        self.last_data_at = None
+
+    def feed(self, data):
+        self.last_data_at = time.monotonic()
+        if self.protocol == PROTOCOL_FRAMED:
+            return [(reader, format_uid(uid)) for reader, uid in self.frames.feed(data)]
+        if self.protocol == PROTOCOL_TEXT:
+            return [(0, line) for line in self.lines.feed(data)]
+        frames = self.frames.feed(data)
+        if frames:
+            self.protocol = PROTOCOL_FRAMED
+            return [(reader, format_uid(uid)) for reader, uid in frames]
+        lines = [line for line in self.lines.feed(data) if TEXT_BADGE.fullmatch(line)]
+        if lines:
+            self.protocol = PROTOCOL_TEXT
+        return [(0, line) for line in lines]
+
+    def stats(self):
+        return {
+            'protocol': self.protocol,
+            'frames': self.frames.frames,
+            'bad_frames': self.frames.bad_frames,
+            'noise_bytes': self.frames.noise_bytes if self.protocol != PROTOCOL_TEXT else 0,
+        }
+
+
+def read_chunk(connection):
+    # Sleeps in the driver until at least one byte arrives (or the port
+    # timeout expires), then takes everything already buffered in one call.
+    data = connection.read(1)
+    if data:
+        waiting = connection.in_waiting
+        if waiting:
+            data += connection.read(waiting)
+    return data
+
+
+def pump_scans(connection, is_running, on_scan, decoder=None):
+    decoder = decoder or SerialDecoder()
+    while is_running():
+        data = read_chunk(connection)
+        if data:
+            for reader, badge_id in decoder.feed(data):
+                on_scan(reader, badge_id)
+
+
+class ArduinoReaderThread(QThread):
+    # badge_scanned carries the reader number from the frame (always 0 with
+    # the text protocol) and the badge ID.
+    badge_scanned = pyqtSignal(int, str)
+    connection_status = pyqtSignal(bool, str)
+
+    def __init__(self, port, baudrate=DEFAULT_BAUDRATE, protocol=PROTOCOL_AUTO):
+        super().__init__()
+        self.port = port
+        self.baudrate = baudrate
+        self.decoder = SerialDecoder(protocol)
+        self.running = False
+        self.serial_connection = None
+
+    def run(self):
+        self.running = True
+        try:
+            self.serial_connection = serial.Serial(self.port, self.baudrate, timeout=READ_TIMEOUT)
+            self.connection_status.emit(True, f"Connecté à {self.port} ({self.baudrate} bauds)")
+            pump_scans(self.serial_connection, self.is_running, self.badge_scanned.emit,
+                       self.decoder)
+        except Exception as e:
+            if self.running:
+                self.connection_status.emit(False, f"Erreur: {str(e)}")
+        finally:
+            if self.serial_connection and self.serial_connection.is_open:
+                self.serial_connection.close()
+
+    def is_running(self):
+        return self.running
+
+    def stop(self):
+        self.running = False
+        connection = self.serial_connection
+        if connection is not None and hasattr(connection, 'cancel_read'):
+            try:
+                connection.cancel_read()
+            except Exception:
+                pass
+        self.wait()
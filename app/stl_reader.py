@@ -0,0 +1,112 @@
+import os
+import numpy as np
+
+# Binary STL: an 80-byte header, a little-endian uint32 triangle count,
+# then one 50-byte record per triangle.
+STL_HEADER_SIZE = 84
+STL_RECORD = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attributes', '<u2'),
+])
+
+# Odd 64-bit constants mixing the three coordinates into one hash.
+_HASH_MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F),
+             np.uint64(0x165667B19E3779F9))
+
+
+def binary_triangle_count(path):
+    # The triangle count if path is a binary STL, else None. Many binary
+    # files start with "solid" too, so only the size tells them apart.
+    size = os.path.getsize(path)
+    if size < STL_HEADER_SIZE:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(STL_HEADER_SIZE - 4)
+        count = int.from_bytes(f.read(4), 'little')
+    if size != STL_HEADER_SIZE + count * STL_RECORD.itemsize:
+        return None
+    return count
+
+
+def unique_rows(corners):
+    # Merges identical float32 (n, 3) rows, n < 2**31. Returns (points,
+    # index) with corners == points[index] and points in order of first
+    # appearance, which keeps neighbouring triangles close in memory.
+    #
+    # Each row gets a 64-bit sort key: a hash of its bits in the high bits,
+    # its position in the low ones. Sorting the keys (much faster than an
+    # argsort) groups equal rows together, first appearance first. Rows
+    # whose hash collided with a different row's are found by comparing
+    # every row with its group's representative, and merged exactly on
+    # their own.
+    count = len(corners)
+    position_bits = max(1, (count - 1).bit_length())
+    bits = corners.view(np.uint32)
+    key = bits[:, 0].astype(np.uint64)
+    key *= _HASH_MIX[0]
+    for column in (1, 2):
+        mixed = bits[:, column].astype(np.uint64)
+        mixed *= _HASH_MIX[column]
+        key ^= mixed
+    del mixed
+    key >>= np.uint64(position_bits)
+    key <<= np.uint64(position_bits)
+    key |= np.arange(count, dtype=np.uint64)
+    key.sort()
+
+    order = (key & np.uint64((1 << position_bits) - 1)).astype(np.int32)
+    key >>= np.uint64(position_bits)
+    first = np.empty(count, dtype=bool)
+    first[:1] = True
+    np.not_equal(key[1:], key[:-1], out=first[1:])
+    del key
+    group = np.cumsum(first, dtype=np.int32)
+    group -= 1
+    representatives = order[first]
+    # Groups come out in hash order; rank them by first appearance.
+    by_position = np.argsort(representatives)
+    rank = np.empty(len(representatives), dtype=np.int32)
+    rank[by_position] = np.arange(len(representatives), dtype=np.int32)
+    index = np.empty(count, dtype=np.int32)
+    index[order] = rank[group]
+    del order, group
+    points = np.take(corners, representatives[by_position], axis=0)
+
+    merged = np.take(points, index, axis=0)
+    if np.array_equal(merged, corners):
+        return points, index
+    merged = merged.view(np.uint32)
+    wrong = np.flatnonzero((merged[:, 0] != bits[:, 0]) | (merged[:, 1] != bits[:, 1])
+                           | (merged[:, 2] != bits[:, 2]))
+    # All copies of a wrongly merged row are in this set, so np.unique on
+    # it alone is exact.
+    extra, extra_index = np.unique(corners[wrong], axis=0, return_inverse=True)
+    index[wrong] = len(points) + extra_index.reshape(-1)
+    return np.concatenate((points, extra)), index
+
+
+def read_binary_stl(path):
+    # Reads a binary STL into (points, triangles): float32 (n, 3) shared
+    # vertices and int32 (m, 3) indices, like vtkSTLReader with merging on.
+    # None when the file is not a binary STL (or too large for int32
+    # indices) and has to go through vtkSTLReader.
+    count = binary_triangle_count(path)
+    if count is None or 3 * count >= 2 ** 31:
+        return None
+    if count == 0:
+        return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int32)
+    records = np.memmap(path, dtype=STL_RECORD, mode='r', offset=STL_HEADER_SIZE, shape=(count,))
+    # Adding 0 copies the corners out of the mapping and turns -0.0 into
+    # 0.0, equal as floats but not as bits.
+    corners = np.add(records['vertices'], np.float32(0)).reshape(-1, 3)
+    del records
+    points, index = unique_rows(corners)
+    triangles = index.reshape(-1, 3)
+    # Triangles whose corners merged into fewer than three points are
+    # dropped, as vtkSTLReader does.
+    keep = ((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2])
+            & (triangles[:, 0] != triangles[:, 2]))
+    if not keep.all():
+        triangles = triangles[keep]
+    return points, triangles
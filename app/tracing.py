@@ -0,0 +1,184 @@
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+# Opt-in timeline tracing in Chrome Trace Event format, for chrome://tracing
+# or ui.perfetto.dev. Enabled with --trace PATH or JDR_TRACE=PATH; spans go
+# to a ring buffer of the last DEFAULT_CAPACITY events and are written to
+# PATH on exit, or on demand with dump(). main.py adds the Qt event loop
+# through TracedApplication; this module itself does not need Qt, so the
+# database layer can use it.
+#
+# Disabled, traced() adds one call and a global lookup, and span() returns
+# a shared no-op context manager, so instrumentation can stay in hot paths.
+# Methods connected straight to a signal that carries more arguments than
+# they take (clicked(bool)...) must not be wrapped: PyQt would pass them all.
+ENV_VAR = "JDR_TRACE"
+DEFAULT_CAPACITY = 100000
+
+
+class TraceRecorder:
+    # Events are tuples appended to a deque, atomic under the GIL, so any
+    # thread records without a lock; the JSON is only built in dump().
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.origin = time.perf_counter_ns()
+        self.started_at = time.time()
+        self._events = collections.deque(maxlen=capacity)
+        self._threads = {}
+        self.recorded = 0
+
+    def complete(self, name, cat, start, end, args=None):
+        self._events.append(('X', name, cat, start, end - start, self._tid(), args))
+        self.recorded += 1
+
+    def instant(self, name, cat, args=None):
+        self._events.append(('i', name, cat, time.perf_counter_ns(), 0, self._tid(), args))
+        self.recorded += 1
+
+    def _tid(self):
+        tid = threading.get_native_id()
+        if tid not in self._threads:
+            name = threading.current_thread().name
+            if name.startswith("Dummy"):
+                # Started by Qt: a QThread subclass or a pool thread.
+                try:
+                    from PyQt5.QtCore import QThread
+                except ImportError:
+                    pass
+                else:
+                    thread = QThread.currentThread()
+                    name = thread.objectName() or type(thread).__name__
+            self._threads[tid] = name
+        return tid
+
+    def events(self):
+        pid = os.getpid()
+        origin = self.origin
+        events = [{'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0,
+                   'args': {'name': "JDR Badge Manager"}}]
+        for tid, name in list(self._threads.items()):
+            events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid,
+                           'args': {'name': name}})
+        for ph, name, cat, start, duration, tid, args in list(self._events):
+            event = {'ph': ph, 'name': name, 'cat': cat, 'pid': pid, 'tid': tid,
+                     'ts': (start - origin) / 1000}
+            if ph == 'X':
+                event['dur'] = duration / 1000
+            else:
+                event['s'] = 't'
+            if args:
+                event['args'] = args
+            events.append(event)
+        return events
+
+    def dump(self, path=None):
+        path = path or self.path
+        trace = {
+            'traceEvents': self.events(),
+            'displayTimeUnit': 'ms',
+            'otherData': {'started_at': self.started_at, 'recorded': self.recorded,
+                          'capacity': self.capacity},
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f)
+        return path
+
+
+_recorder = None
+
+
+def enable(path=None, capacity=DEFAULT_CAPACITY):
+    global _recorder
+    _recorder = TraceRecorder(capacity, path)
+    return _recorder
+
+
+def enable_from_env():
+    path = os.environ.get(ENV_VAR)
+    return enable(path) if path else None
+
+
+def disable():
+    global _recorder
+    _recorder = None
+
+
+def enabled():
+    return _recorder is not None
+
+
+def recorder():
+    return _recorder
+
+
+def dump(path=None):
+    if _recorder is None:
+        return None
+    return _recorder.dump(path)
+
+
+def instant(name, cat="app", **args):
+    if _recorder is not None:
+        _recorder.instant(name, cat, args)
+
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, recorder, name, cat, args):
+        self.recorder = recorder
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.complete(self.name, self.cat, self.start, time.perf_counter_ns(), self.args)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, cat="app", **args):
+    if _recorder is None:
+        return _NULL_SPAN
+    return _Span(_recorder, name, cat, args)
+
+
+def traced(cat="app", name=None):
+    # Decorator: records every call as a span named after the function.
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                recorder.complete(label, cat, start, time.perf_counter_ns())
+        return wrapper
+    return decorate
+
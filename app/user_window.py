@@ -1,10 +1,17 @@
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFrame, QGridLayout
 )
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QColor, QPalette
 import os
+import time
+from functools import partial
 from app import database as db
+from app.async_db import get_async_db
+from app.latency import get_latency_tracker
+from app import tracing
+from app.meshes import LOD_TRIANGLE_BUDGET, get_mesh_cache, mesh_key
+from app.mesh_loader import MeshLoader
 
 try:
     import vtk
@@ -13,6 +20,29 @@ try:
 except ImportError:
     VTK_AVAILABLE = False
 
+LEFT_STATS = (("Vigueur", "vigueur"), ("Présence", "presence"), ("Agilité", "agilite"))
+RIGHT_STATS = (("Intelligence", "intelligence"), ("Volonté", "volonte"), ("Ruse", "ruse"))
+
+ROTATION_INTERVAL = 50
+# A rotation frame slower than this drops the model to a coarser level of
+# detail, leaving the rest of the tick to the event loop. A finer level is
+# tried when its predicted frame time fits in LOD_HEADROOM of the budget.
+FRAME_BUDGET = 0.030
+LOD_HEADROOM = 0.7
+# Frames averaged at a level before it is judged.
+LOD_SAMPLES = 5
+# After the user lets go of the model, it stays still (at full detail)
+# this long before spinning again.
+ROTATION_RESUME_DELAY = 3000
+
+SITUATION_COLORS = {
+    "recherche": "#ff4444",
+    "en_fuite": "#ff8800",
+    "RAS": "#44ff44",
+    "endette": "#ffff00",
+    "malfrat": "#ff00ff"
+}
+
 class StatBubble(QFrame):
     def __init__(self, stat_name, parent=None):
         super().__init__(parent)
@@ -77,13 +107,42 @@ class StatBubble(QFrame):
 
 
 class VTKWidget(QWidget):
-    def __init__(self, parent=None):
+    # Models are parsed on MeshLoader's threads, so a large STL never
+    # blocks the GUI thread; only the finished actor is attached here.
+    # A model already in the mesh cache is shown synchronously.
+    #
+    # Each model comes with levels of detail (see meshes.build_levels). A
+    # freshly parsed model is first shown still, at full detail, and starts
+    # spinning once its levels are ready. While it moves, the level is
+    # picked from the measured frame time: coarser when frames overrun
+    # FRAME_BUDGET, finer when the hardware has room for it. Still frames
+    # are always drawn at full detail.
+    model_ready = pyqtSignal(str)
+    load_failed = pyqtSignal(str, str)
+    
+    def __init__(self, parent=None, triangle_budget=LOD_TRIANGLE_BUDGET):
         super().__init__(parent)
+        self.triangle_budget = triangle_budget
         self.rotation_angle = 0
         self.actor = None
+        self.model_path = None
+        self.levels = ()
+        self.mappers = []
+        self.level = 0
+        self.moving_level = 0
+        self.level_times = {}
+        self.frame_time = None
+        self.frame_samples = 0
+        # Seconds per triangle of the last judged level, carried over to
+        # pick the starting level of the next model.
+        self.triangle_cost = None
         self.renderer = None
         self.vtk_widget = None
         self.rotation_timer = None
+        self.resume_timer = None
+        self.loader = None
+        self.loading_path = None
+        self.loading_key = None
         self.setup_ui()
         
     def setup_ui(self):
@@ -110,6 +169,19 @@ class VTKWidget(QWidget):
         self.rotation_timer = QTimer(self)
         self.rotation_timer.timeout.connect(self.rotate_model)
         
+        self.resume_timer = QTimer(self)
+        self.resume_timer.setSingleShot(True)
+        self.resume_timer.timeout.connect(self.start_rotation)
+        
+        interactor = self.vtk_widget.GetRenderWindow().GetInteractor()
+        interactor.AddObserver("StartInteractionEvent", self.on_interaction_started)
+        interactor.AddObserver("EndInteractionEvent", self.on_interaction_ended)
+        
+        self.loader = MeshLoader(self)
+        self.loader.parsed.connect(self.on_mesh_parsed)
+        self.loader.loaded.connect(self.on_mesh_loaded)
+        self.loader.failed.connect(self.on_mesh_failed)
+        
         self.vtk_widget.Initialize()
         self.vtk_widget.Start()
         
@@ -131,14 +203,35 @@ class VTKWidget(QWidget):
         light2.SetIntensity(0.4)
         self.renderer.AddLight(light2)
         
-    def show_placeholder_text(self, text=None):
+    def show_message(self, text):
         if not VTK_AVAILABLE or not self.renderer:
             return
             
         self.clear_scene()
+        message = vtk.vtkTextActor()
+        message.SetInput(text)
+        message.GetTextProperty().SetFontSize(18)
+        message.GetTextProperty().SetColor(0.55, 0.55, 0.55)
+        message.GetTextProperty().SetJustificationToCentered()
+        message.GetTextProperty().SetVerticalJustificationToCentered()
+        message.GetPositionCoordinate().SetCoordinateSystemToNormalizedViewport()
+        message.SetPosition(0.5, 0.5)
+        self.renderer.AddViewProp(message)
         self.vtk_widget.GetRenderWindow().Render()
         
+    @tracing.traced("vtk")
+    def show_placeholder_text(self, text=None):
+        if not VTK_AVAILABLE or not self.renderer:
+            return
+            
+        self.cancel_load()
+        self.show_message(text or "")
+        get_latency_tracker().finish('render')
+        
+    @tracing.traced("vtk")
     def load_stl(self, file_path):
+        # Returns False when the file cannot be shown at all; otherwise the
+        # model is on screen, or will be once model_ready is emitted.
         if not VTK_AVAILABLE or not self.renderer:
             return False
             
@@ -146,31 +239,71 @@ class VTKWidget(QWidget):
             self.show_placeholder_text(f"Fichier non trouvé:\n{file_path}")
             return False
             
-        self.clear_scene()
-        
         try:
-            reader = vtk.vtkSTLReader()
-            reader.SetFileName(file_path)
-            reader.Update()
-            
-            bounds = reader.GetOutput().GetBounds()
-            center_x = (bounds[0] + bounds[1]) / 2.0
-            center_y = (bounds[2] + bounds[3]) / 2.0
-            center_z = (bounds[4] + bounds[5]) / 2.0
-            
-            center_transform = vtk.vtkTransform()
-            center_transform.Translate(-center_x, -center_y, -center_z)
-            
-            center_filter = vtk.vtkTransformPolyDataFilter()
-            center_filter.SetInputConnection(reader.GetOutputPort())
-            center_filter.SetTransform(center_transform)
-            center_filter.Update()
+            key = mesh_key(file_path, self.triangle_budget)
+        except OSError as e:
+            self.show_placeholder_text(f"Erreur de chargement:\n{str(e)}")
+            return False
+        if file_path == self.loading_path and key == self.loading_key:
+            # Same badge scanned again mid-load: let the load finish.
+            return True
+        self.cancel_load()
             
-            mapper = vtk.vtkPolyDataMapper()
-            mapper.SetInputConnection(center_filter.GetOutputPort())
+        levels = get_mesh_cache().get(key)
+        if levels is not None:
+            return self.show_mesh(file_path, levels)
             
+        self.loading_path = file_path
+        self.loading_key = key
+        self.show_message("Chargement du modèle...")
+        self.loader.load(file_path, key, self.triangle_budget)
+        return True
+        
+    def cancel_load(self):
+        if self.loader is not None and self.loading_path is not None:
+            self.loader.cancel()
+        self.loading_path = None
+        self.loading_key = None
+        
+    def on_mesh_parsed(self, file_path, mesh):
+        # Full detail is ready; the levels of detail are still being built.
+        if file_path != self.loading_path:
+            return
+        self.show_mesh(file_path, (mesh,), rotate=False)
+        
+    def on_mesh_loaded(self, file_path, levels):
+        if file_path != self.loading_path:
+            return
+        self.loading_path = None
+        self.loading_key = None
+        if self.actor is not None and self.model_path == file_path:
+            # Still showing the parsed mesh: keep its mapper, whose data is
+            # already on the GPU.
+            self.set_levels(self.levels[:1] + levels[1:], self.mappers[:1])
+            self.start_rotation()
+        else:
+            self.show_mesh(file_path, levels)
+        
+    def on_mesh_failed(self, file_path, error):
+        if file_path != self.loading_path:
+            return
+        self.loading_path = None
+        self.loading_key = None
+        self.show_placeholder_text(f"Erreur de chargement:\n{str(error)}")
+        self.load_failed.emit(file_path, str(error))
+        
+    @tracing.traced("vtk")
+    def show_mesh(self, file_path, levels, rotate=True):
+        get_latency_tracker().mark('mesh')
+        self.clear_scene()
+        
+        try:
             self.actor = vtk.vtkActor()
-            self.actor.SetMapper(mapper)
+            self.model_path = file_path
+            self.set_levels(levels)
+            # A cached model starts at the level it will spin at, so its
+            # full detail is only uploaded once it holds still.
+            self.set_level(self.moving_level if rotate else 0)
             
             self.actor.GetProperty().SetColor(0.3, 0.6, 0.9)
             self.actor.GetProperty().SetSpecular(0.4)
@@ -188,38 +321,146 @@ class VTKWidget(QWidget):
             camera.Elevation(10)
             camera.Zoom(0.85)
             
-            self.vtk_widget.GetRenderWindow().Render()
+            with tracing.span("Render", "vtk"):
+                self.vtk_widget.GetRenderWindow().Render()
+            get_latency_tracker().finish('render')
             
             self.rotation_angle = 0
-            self.rotation_timer.start(50)
+            if rotate:
+                self.start_rotation()
+            self.model_ready.emit(file_path)
             
             return True
             
         except Exception as e:
             self.show_placeholder_text(f"Erreur de chargement:\n{str(e)}")
+            self.load_failed.emit(file_path, str(e))
             return False
             
+    def set_levels(self, levels, mappers=()):
+        self.levels = levels
+        self.mappers = list(mappers)
+        for mesh in levels[len(self.mappers):]:
+            mapper = vtk.vtkPolyDataMapper()
+            mapper.SetInputData(mesh)
+            self.mappers.append(mapper)
+        self.level_times = {}
+        self.moving_level = self.starting_level()
+        
+    def starting_level(self):
+        # The finest level expected to fit the frame budget, judging by the
+        # previous model; before any measurement, the finest one within the
+        # triangle budget.
+        for level, mesh in enumerate(self.levels):
+            triangles = mesh.GetNumberOfCells()
+            if self.triangle_cost is None:
+                if triangles <= self.triangle_budget:
+                    return level
+            elif triangles * self.triangle_cost <= FRAME_BUDGET * LOD_HEADROOM:
+                return level
+        return len(self.levels) - 1
+        
+    def set_level(self, level):
+        self.frame_time = None
+        self.frame_samples = 0
+        if level == self.level and self.actor.GetMapper() is self.mappers[level]:
+            return
+        self.level = level
+        self.actor.SetMapper(self.mappers[level])
+        tracing.instant("lod", "vtk", level=level,
+                        triangles=self.levels[level].GetNumberOfCells())
+        
+    def start_rotation(self):
+        # Not before the levels of detail are ready.
+        if self.actor is not None and self.loading_path is None and self.rotation_timer:
+            self.rotation_timer.start(ROTATION_INTERVAL)
+            
+    @tracing.traced("vtk")
     def rotate_model(self):
         if not self.actor or not self.renderer:
             return
             
+        if self.level != self.moving_level:
+            self.set_level(self.moving_level)
         self.actor.RotateZ(0.5)
+        start = time.perf_counter()
         self.vtk_widget.GetRenderWindow().Render()
+        self.record_frame(time.perf_counter() - start)
+        
+    def record_frame(self, elapsed):
+        # Frame times are averaged over LOD_SAMPLES frames per level. A
+        # level that overran is remembered, so the model does not keep
+        # climbing back to it.
+        self.frame_samples += 1
+        if self.frame_samples == 1:
+            # The first frame at a level includes its upload to the GPU.
+            return
+        samples = self.frame_samples - 1
+        if self.frame_time is None:
+            self.frame_time = elapsed
+        else:
+            self.frame_time += (elapsed - self.frame_time) / min(samples, LOD_SAMPLES)
+        if samples < LOD_SAMPLES:
+            return
+        level = self.level
+        self.level_times[level] = self.frame_time
+        self.triangle_cost = self.frame_time / self.levels[level].GetNumberOfCells()
+        if self.frame_time > FRAME_BUDGET and level + 1 < len(self.levels):
+            self.moving_level = level + 1
+        elif level > 0:
+            finer = self.levels[level - 1].GetNumberOfCells()
+            expected = self.level_times.get(level - 1, finer * self.triangle_cost)
+            if expected <= FRAME_BUDGET * LOD_HEADROOM:
+                self.moving_level = level - 1
+        if self.moving_level != level:
+            self.set_level(self.moving_level)
+        
+    def on_interaction_started(self, caller, event):
+        # The user is turning the model: hold the spin and keep the
+        # interactive renders at the moving level.
+        if not self.actor:
+            return
+        self.resume_timer.stop()
+        self.stop_rotation()
+        self.set_level(self.moving_level)
+        
+    def on_interaction_ended(self, caller, event):
+        if not self.actor:
+            return
+        self.show_still()
+        self.resume_timer.start(ROTATION_RESUME_DELAY)
+        
+    def show_still(self):
+        # The model is not moving: draw it once at full detail.
+        if not self.actor or self.level == 0:
+            return
+        self.set_level(0)
+        with tracing.span("Render", "vtk", still=True):
+            self.vtk_widget.GetRenderWindow().Render()
         
     def clear_scene(self):
         if self.rotation_timer:
             self.rotation_timer.stop()
+            self.resume_timer.stop()
             
         if self.renderer:
             self.renderer.RemoveAllViewProps()
             self.actor = None
+            self.model_path = None
+            self.levels = ()
+            self.mappers = []
             
     def stop_rotation(self):
         if self.rotation_timer:
             self.rotation_timer.stop()
             
     def shutdown(self):
+        self.cancel_load()
+        if self.loader is not None:
+            self.loader.shutdown()
         self.stop_rotation()
+        if self.resume_timer:
+            self.resume_timer.stop()
         if self.renderer:
             self.renderer.RemoveAllViewProps()
         if self.vtk_widget:
@@ -268,7 +509,7 @@ class UserWindow(QMainWindow):
         left_layout.setSpacing(10)
         
         self.left_bubbles = {}
-        for stat_name in ["Vigueur", "Présence", "Agilité"]:
+        for stat_name, _ in LEFT_STATS:
             bubble = StatBubble(stat_name)
             self.left_bubbles[stat_name] = bubble
             left_layout.addWidget(bubble)
@@ -288,6 +529,7 @@ class UserWindow(QMainWindow):
         center_layout.setContentsMargins(10, 10, 10, 10)
         
         self.vtk_widget = VTKWidget()
+        self.vtk_widget.load_failed.connect(self.on_model_failed)
         center_layout.addWidget(self.vtk_widget)
         
         self.model_label = QLabel("")
@@ -305,7 +547,7 @@ class UserWindow(QMainWindow):
         right_layout.setSpacing(10)
         
         self.right_bubbles = {}
-        for stat_name in ["Intelligence", "Volonté", "Ruse"]:
+        for stat_name, _ in RIGHT_STATS:
             bubble = StatBubble(stat_name)
             self.right_bubbles[stat_name] = bubble
             right_layout.addWidget(bubble)
@@ -362,49 +604,50 @@ class UserWindow(QMainWindow):
         
         main_layout.addLayout(bottom_layout)
         
+    @tracing.traced("ui")
     def display_character(self, badge_id):
+        # The lookup runs off the GUI thread; a newer scan supersedes this
+        # one, so only the last badge of a quick burst reaches show_character.
+        if badge_id != self.current_badge_id:
+            # The previous character's model is not worth finishing.
+            self.vtk_widget.cancel_load()
+        self.current_badge_id = badge_id
+        get_latency_tracker().mark('dispatch')
+        get_async_db().submit("user.display", db.get_character_by_badge, badge_id,
+                              callback=partial(self.show_character, badge_id))
+        
+    @tracing.traced("ui")
+    def show_character(self, badge_id, character):
+        # The latency stages end in VTKWidget with the first render of the
+        # model, once it is loaded; without VTK they end here.
+        latency = get_latency_tracker()
+        latency.mark('lookup')
         self.current_badge_id = badge_id
-        self.current_character = db.get_character_by_badge(badge_id)
+        self.current_character = character
         
         if not self.current_character:
             self.name_label.setText("Personnage non trouvé")
+            latency.mark('widgets')
             self.vtk_widget.show_placeholder_text("Personnage non trouvé")
+            if not VTK_AVAILABLE:
+                latency.finish()
             return
             
         char = self.current_character
         
-        self.name_label.setText(char[5] or "Sans nom")
-        
-        stat_mapping_left = {
-            "Vigueur": char[6],
-            "Présence": char[11],
-            "Agilité": char[7]
-        }
+        self.name_label.setText(char.nom_perso or "Sans nom")
         
-        stat_mapping_right = {
-            "Intelligence": char[8],
-            "Volonté": char[10],
-            "Ruse": char[9]
-        }
-        
-        for stat_name, value in stat_mapping_left.items():
-            self.left_bubbles[stat_name].set_value(value or 0)
+        for stat_name, field in LEFT_STATS:
+            self.left_bubbles[stat_name].set_value(getattr(char, field) or 0)
             
-        for stat_name, value in stat_mapping_right.items():
-            self.right_bubbles[stat_name].set_value(value or 0)
+        for stat_name, field in RIGHT_STATS:
+            self.right_bubbles[stat_name].set_value(getattr(char, field) or 0)
             
-        situation = db.get_situation_from_row(char)
+        situation = char.situation
         situation_display = db.get_situation_display(situation)
         self.situation_label.setText(f"Situation: {situation_display}")
         
-        situation_colors = {
-            "recherche": "#ff4444",
-            "en_fuite": "#ff8800",
-            "RAS": "#44ff44",
-            "endette": "#ffff00",
-            "malfrat": "#ff00ff"
-        }
-        color = situation_colors.get(situation, "#1a1a1a")
+        color = SITUATION_COLORS.get(situation, "#1a1a1a")
         self.situation_frame.setStyleSheet(f"""
             QFrame {{
                 background-color: {color};
@@ -421,10 +664,11 @@ class UserWindow(QMainWindow):
         else:
             self.situation_label.setStyleSheet("color: #ffffff; background: transparent; border: none;")
         
-        credits = char[17] or 0
+        credits = char.credits or 0
         self.credits_label.setText(f"Crédits: {credits} $")
         
-        file_path = char[4]
+        latency.mark('widgets')
+        file_path = char.file_path
         if file_path:
             if file_path.startswith("3D/") or file_path.startswith("3D\\"):
                 full_path = file_path
@@ -440,6 +684,11 @@ class UserWindow(QMainWindow):
         else:
             self.model_label.setText("Aucun modèle 3D associé")
             self.vtk_widget.show_placeholder_text("Aucun modèle 3D\nassocié à ce personnage")
+        if not VTK_AVAILABLE:
+            latency.finish()
+            
+    def on_model_failed(self, file_path, error):
+        self.model_label.setText(f"Erreur de chargement: {os.path.basename(file_path)}")
             
     def closeEvent(self, event):
         if self.vtk_widget:
@@ -0,0 +1,108 @@
+# Compare badge lookups per second: the historical open-per-call pattern,
+# the persistent per-thread connection from app.database, and the same
+# connection with the badge LRU cache in front of it. Badges are 4-byte
+# card UIDs; the persistent connection is measured both on the text
+# badge_id index and on the integer badge_key index (keys precomputed, so
+# only the SQLite side differs); the cached lines go through the full
+# get_character_by_badge path, normalization included.
+#
+# Lookups cycle through a session's worth of players (--players), the
+# working set the badge cache is sized for. The last line draws from the
+# whole roster instead; with more characters than BADGE_CACHE_SIZE it
+# mostly misses, and shows what the cache costs then.
+#
+#   python benchmarks/bench_connections.py --characters 1000 --lookups 20000 --players 32
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import database as db
+from app.badge_key import badge_key, format_uid
+
+
+def uid(i):
+    return format_uid((0x04000000 + i * 2654435761 % 0x00FFFFFF).to_bytes(4, 'big'))
+
+
+def populate(count):
+    futures = [db.add_character(uid(i), '', f'Perso {i}', 5, 5, 5, 5, 5, 5, 100, 'RAS')
+               for i in range(count)]
+    for future in futures:
+        future.result()
+
+
+def lookup_open_per_call(badge_id):
+    conn = sqlite3.connect(db.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM rfid_log WHERE badge_id = ?', (badge_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+def measure(lookup, badges):
+    start = time.perf_counter()
+    for badge_id in badges:
+        lookup(badge_id)
+    elapsed = time.perf_counter() - start
+    return len(badges) / elapsed
+
+
+def measure_cached(badges):
+    # Cache emptied first, so the rate includes the misses that fill it.
+    db.clear_badge_cache()
+    rate = measure(db.get_character_by_badge, badges)
+    return rate, db.badge_cache_stats()['hit_rate']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Badge lookup throughput: open-per-call vs persistent connection")
+    parser.add_argument('--characters', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--players', type=int, default=32,
+                        help="distinct badges scanned during the session")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_database()
+        populate(args.characters)
+
+        rng = random.Random(42)
+        players = [uid(i) for i in rng.sample(range(args.characters),
+                                              min(args.players, args.characters))]
+        badges = [rng.choice(players) for _ in range(args.lookups)]
+        roster = [uid(rng.randrange(args.characters)) for _ in range(args.lookups)]
+
+        conn = db.get_connection()
+        legacy = measure(lookup_open_per_call, badges)
+        cursor = conn.cursor()
+        cursor.row_factory = db.character_factory
+        text_key = measure(lambda badge_id: cursor.execute(
+            f'SELECT {db.CHARACTER_COLUMNS} FROM rfid_log WHERE badge_id = ?',
+            (badge_id,)).fetchone(), badges)
+        keys = [badge_key(badge_id) for badge_id in badges]
+        persistent = measure(lambda key: cursor.execute(
+            f'SELECT {db.CHARACTER_COLUMNS} FROM rfid_log WHERE badge_key = ?',
+            (key,)).fetchone(), keys)
+        cached, hit_rate = measure_cached(badges)
+        roster_cached, roster_hit_rate = measure_cached(roster)
+        db.close_all_connections()
+
+    print(f"open-per-call        : {legacy:12,.0f} lookups/s")
+    print(f"persistent, text id  : {text_key:12,.0f} lookups/s ({text_key / legacy:.1f}x)")
+    print(f"persistent, int key  : {persistent:12,.0f} lookups/s ({persistent / legacy:.1f}x)")
+    print(f"badge cache          : {cached:12,.0f} lookups/s ({cached / legacy:.1f}x, "
+          f"hit rate {hit_rate:.1%})")
+    print(f"badge cache, roster  : {roster_cached:12,.0f} lookups/s "
+          f"({roster_cached / legacy:.1f}x, hit rate {roster_hit_rate:.1%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Credit transactions per second through the ledger API: single-badge
+# increments and two-badge transfers submitted from several producer
+# threads, followed by a full ledger consistency check.
+#
+#   python benchmarks/bench_credits.py --transactions 5000 --producers 4
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import database as db
+
+
+def run(count, producers, characters, transfer_ratio):
+    futures = [[] for _ in range(producers)]
+
+    def produce(index):
+        rng = random.Random(index)
+        for _ in range(count // producers):
+            a = f'BADGE{rng.randrange(characters):06d}'
+            if rng.random() < transfer_ratio:
+                b = f'BADGE{rng.randrange(characters):06d}'
+                if a != b:
+                    futures[index].append(db.transfer_credits(a, b, rng.randint(1, 50), 'bench'))
+                    continue
+            futures[index].append(db.apply_credits(a, rng.randint(-20, 20), 'bench'))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=produce, args=(i,)) for i in range(producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done = 0
+    for chunk in futures:
+        for future in chunk:
+            future.result()
+            done += 1
+    return done, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Credit ledger throughput")
+    parser.add_argument('--characters', type=int, default=500)
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--producers', type=int, default=4)
+    parser.add_argument('--transfer-ratio', type=float, default=0.3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_database()
+        db.import_characters({'badge_id': f'BADGE{i:06d}', 'nom_perso': f'Perso {i}'}
+                             for i in range(args.characters)).result()
+
+        before = db.writer_stats()
+        done, elapsed = run(args.transactions, args.producers, args.characters, args.transfer_ratio)
+        after = db.writer_stats()
+
+        start = time.perf_counter()
+        mismatches = db.check_ledger()
+        check = time.perf_counter() - start
+        db.close_all_connections()
+
+    commits = after['commits'] - before['commits']
+    print(f"transactions : {done} ({args.transfer_ratio:.0%} transfers, {args.producers} producers)")
+    print(f"throughput   : {done / elapsed:,.0f} tx/s in {commits} commits")
+    print(f"ledger check : {len(mismatches)} mismatches ({check * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Row decoding cost: raw tuples, sqlite3.Row and the Character record
+# produced by app.database.character_factory, plus the per-scan cost of
+# reading every displayed field back out of each representation.
+#
+#   python benchmarks/bench_row_decoding.py --rows 50000
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import database as db
+
+
+def build(rows):
+    db.DB_PATH = ':memory:'
+    db.init_database()
+    conn = db.get_connection()
+    with conn:
+        conn.executemany(
+            '''INSERT INTO rfid_log (badge_id, file_path, nom_perso, vigueur, agilite, intelligence,
+               ruse, volonte, presence, credits, situation)
+               VALUES (?, '', ?, 5, 6, 7, 8, 9, 10, 100, 'endette')''',
+            ((f'BADGE{i:07d}', f'Perso {i}') for i in range(rows)))
+    return conn
+
+
+def fetch(conn, factory):
+    cursor = conn.cursor()
+    cursor.row_factory = factory
+    start = time.perf_counter()
+    rows = cursor.execute(f'SELECT {db.CHARACTER_COLUMNS} FROM rfid_log').fetchall()
+    return rows, time.perf_counter() - start
+
+
+def read_tuple(row):
+    return (row[4], row[5], row[6], row[7], row[8], row[9], row[10], row[11], row[12])
+
+
+def read_sqlite_row(row):
+    return (row['nom_perso'], row['vigueur'], row['agilite'], row['intelligence'], row['ruse'],
+            row['volonte'], row['presence'], row['credits'], row['situation'])
+
+
+def read_character(char):
+    return (char.nom_perso, char.vigueur, char.agilite, char.intelligence, char.ruse,
+            char.volonte, char.presence, char.credits, char.situation)
+
+
+def access(rows, reader):
+    start = time.perf_counter()
+    for row in rows:
+        reader(row)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Row decoding micro-benchmark")
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    conn = build(args.rows)
+    variants = (
+        ('tuple', None, read_tuple),
+        ('sqlite3.Row', sqlite3.Row, read_sqlite_row),
+        ('Character', db.character_factory, read_character),
+    )
+    print(f"{'representation':<14} {'decode ns/row':>14} {'access ns/row':>14}")
+    for name, factory, reader in variants:
+        rows, decode = fetch(conn, factory)
+        read = access(rows, reader)
+        print(f"{name:<14} {decode / len(rows) * 1e9:14.0f} {read / len(rows) * 1e9:14.0f}")
+    db.close_all_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Idle CPU and scan latency of the serial reader loop, measured against a
+# local pty pair standing in for the Arduino (Linux/macOS only). Compares
+# the old busy loop on in_waiting with the blocking read used by
+# ArduinoReaderThread.
+#
+#   python benchmarks/bench_serial_idle.py --idle 5 --scans 200
+import argparse
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+
+import serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.serial_reader import READ_TIMEOUT, pump_scans
+
+
+def busy_poll(connection, is_running, on_scan):
+    while is_running():
+        if connection.in_waiting > 0:
+            line = connection.readline().decode('utf-8').strip()
+            if line:
+                on_scan(0, line)
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(loop, idle, scans):
+    master, slave = os.openpty()
+    connection = serial.Serial(os.ttyname(slave), 9600, timeout=READ_TIMEOUT)
+    received = []
+    arrived = threading.Event()
+    running = [True]
+
+    def on_scan(reader, badge_id):
+        received.append((badge_id, time.perf_counter()))
+        arrived.set()
+
+    thread = threading.Thread(target=loop, args=(connection, lambda: running[0], on_scan),
+                              daemon=True)
+    thread.start()
+
+    start_cpu, start = cpu_seconds(), time.perf_counter()
+    time.sleep(idle)
+    idle_cpu = (cpu_seconds() - start_cpu) / (time.perf_counter() - start)
+
+    latencies = []
+    for i in range(scans):
+        arrived.clear()
+        sent = time.perf_counter()
+        os.write(master, f'{i:02x}:1b:2c:3d\r\n'.encode())
+        if arrived.wait(2):
+            latencies.append((received[-1][1] - sent) * 1000)
+
+    running[0] = False
+    if hasattr(connection, 'cancel_read'):
+        connection.cancel_read()
+    thread.join(READ_TIMEOUT * 4)
+    connection.close()
+    os.close(master)
+    return idle_cpu, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--idle', type=float, default=5.0, help='seconds without traffic')
+    parser.add_argument('--scans', type=int, default=200)
+    args = parser.parse_args()
+
+    for name, loop in (('busy poll', busy_poll), ('blocking read', pump_scans)):
+        idle_cpu, latencies = run(loop, args.idle, args.scans)
+        print(f'{name:14s} idle CPU {idle_cpu * 100:6.1f}%  '
+              f'received {len(latencies)}/{args.scans}  '
+              f'latency p50 {statistics.median(latencies):.3f} ms  '
+              f'max {max(latencies):.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
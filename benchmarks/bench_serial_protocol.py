@@ -0,0 +1,65 @@
+# Host-side decoding cost and robustness of the two serial protocols:
+# newline-split text lines versus the framed protocol, on the same badges.
+# A fraction of frames is corrupted and noise is injected between frames to
+# check that the parser resynchronises and only drops damaged frames.
+#
+#   python benchmarks/bench_serial_protocol.py --badges 100000 --corrupt 0.01
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.serial_reader import (
+    PROTOCOL_FRAMED, PROTOCOL_TEXT, SerialDecoder, encode_frame, format_uid,
+)
+
+
+def decode(protocol, stream, chunk):
+    decoder = SerialDecoder(protocol)
+    received = []
+    start = time.perf_counter()
+    for pos in range(0, len(stream), chunk):
+        received += decoder.feed(stream[pos:pos + chunk])
+    return time.perf_counter() - start, received, decoder
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--badges', type=int, default=100000)
+    parser.add_argument('--corrupt', type=float, default=0.01, help='fraction of damaged frames')
+    parser.add_argument('--noise', type=float, default=0.05, help='fraction of frames followed by noise')
+    parser.add_argument('--chunk', type=int, default=64, help='bytes per read')
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    uids = [bytes(rnd.randrange(256) for _ in range(rnd.choice((4, 7)))) for _ in range(args.badges)]
+
+    text = b''.join(format_uid(uid).encode() + b'\r\n' for uid in uids)
+    elapsed, received, _ = decode(PROTOCOL_TEXT, text, args.chunk)
+    print(f'text    {len(text) / 1e6:6.2f} MB  {len(received) / elapsed:10.0f} badges/s  '
+          f'{len(received)}/{len(uids)} decoded')
+
+    framed = bytearray()
+    expected = []
+    for uid in uids:
+        frame = bytearray(encode_frame(uid))
+        if rnd.random() < args.corrupt:
+            frame[rnd.randrange(1, len(frame))] ^= 1 << rnd.randrange(8)
+        else:
+            expected.append(format_uid(uid))
+        framed += frame
+        if rnd.random() < args.noise:
+            framed += bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 16)))
+    elapsed, received, decoder = decode(PROTOCOL_FRAMED, bytes(framed), args.chunk)
+    stats = decoder.stats()
+    recovered = sum(1 for got, want in zip((badge for _, badge in received), expected) if got == want)
+    print(f'framed  {len(framed) / 1e6:6.2f} MB  {len(received) / elapsed:10.0f} badges/s  '
+          f'{len(received)}/{len(uids)} decoded, {recovered} in order of {len(expected)} intact, '
+          f'{stats["bad_frames"]} rejected starts, {stats["noise_bytes"]} noise bytes')
+
+
+if __name__ == '__main__':
+    main()
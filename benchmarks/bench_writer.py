@@ -0,0 +1,88 @@
+# Write throughput for bursts of mutations: one commit per write (the
+# pattern used before the writer thread) against the group-committing
+# DatabaseWriter, with several producer threads submitting concurrently.
+#
+#   python benchmarks/bench_writer.py --writes 500 --producers 4 --synchronous FULL
+#
+# With the default synchronous=NORMAL a WAL commit does not fsync, so the
+# gain mostly shows on slow disks or with --synchronous FULL.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import database as db
+
+
+def values(badge_id):
+    return ('', f'Perso {badge_id}', 6, 6, 6, 6, 6, 6, 200, 'endette', badge_id)
+
+
+def commit_per_write(badges):
+    conn = db.get_connection()
+    start = time.perf_counter()
+    for badge_id in badges:
+        with conn:
+            db._update_character(conn, values(badge_id))
+    return time.perf_counter() - start
+
+
+def group_commit(badges, producers):
+    chunks = [badges[i::producers] for i in range(producers)]
+    futures = [[] for _ in chunks]
+
+    def produce(index):
+        for badge_id in chunks[index]:
+            futures[index].append(db.update_character(badge_id, *values(badge_id)[:-1]))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=produce, args=(i,)) for i in range(producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for chunk in futures:
+        for future in chunk:
+            future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Burst write throughput")
+    parser.add_argument('--characters', type=int, default=1000)
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--producers', type=int, default=4)
+    parser.add_argument('--synchronous', choices=('OFF', 'NORMAL', 'FULL'), default='NORMAL')
+    args = parser.parse_args()
+
+    db.PRAGMAS = tuple(p for p in db.PRAGMAS if 'synchronous' not in p) + (
+        f"PRAGMA synchronous={args.synchronous}",)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_database()
+        futures = [db.add_character(f'BADGE{i:06d}', '', f'Perso {i}', 5, 5, 5, 5, 5, 5, 100, 'RAS')
+                   for i in range(args.characters)]
+        futures[-1].result()
+
+        badges = [f'BADGE{i % args.characters:06d}' for i in range(args.writes)]
+        baseline = commit_per_write(badges)
+        before = db.writer_stats()
+        grouped = group_commit(badges, args.producers)
+        after = db.writer_stats()
+        db.close_all_connections()
+
+    commits = after['commits'] - before['commits']
+    operations = after['operations'] - before['operations']
+    print(f"commit per write : {args.writes / baseline:10,.0f} writes/s ({args.writes} commits)")
+    print(f"group commit     : {args.writes / grouped:10,.0f} writes/s "
+          f"({commits} commits, {operations / max(commits, 1):.1f} writes/commit, "
+          f"{args.producers} producers)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+# Reproducible benchmark suite: builds synthetic rosters and meshes (see
+# synthetic.py), times the database functions, the scan pipeline, the
+# admin list refresh, the STL readers, VTKWidget.load_stl and the rotation
+# frame time at each level of detail, and writes the results as JSON.
+# Given a baseline, every case is compared against it and the run fails
+# when one got slower than the tolerance allows.
+#
+#   python benchmarks/run_suite.py --profile quick --output results.json
+#   python benchmarks/run_suite.py --baseline benchmarks/baseline.json
+#   python benchmarks/run_suite.py --save-baseline benchmarks/baseline.json
+#
+# Qt runs on the offscreen platform unless a display is available (run
+# under xvfb-run to get a real OpenGL context for VTK). Timings are only
+# comparable between runs on the same machine: regenerate the baseline
+# with --save-baseline when the hardware changes.
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+if not os.environ.get('DISPLAY') and not os.environ.get('QT_QPA_PLATFORM'):
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+from app import database as db
+from app import scan_trace
+from app.async_db import shutdown_async_db
+
+import synthetic
+
+PROFILES = {
+    'quick': {
+        'rosters': (1000, 10000),
+        'ui_rosters': (1000, 10000),
+        'meshes': (10000, 100000),
+        'scans': 2000,
+        'lookups': 2000,
+        'repeat': 5,
+    },
+    'full': {
+        'rosters': (1000, 10000, 100000, 1000000),
+        'ui_rosters': (1000, 10000, 100000),
+        'meshes': (10000, 100000, 1000000, 5000000),
+        'scans': 20000,
+        'lookups': 20000,
+        'repeat': 5,
+    },
+}
+
+# A case regresses when its median is more than this much slower than the
+# baseline median.
+DEFAULT_TOLERANCE = 0.25
+
+# Distinct badges scanned in the warm lookup case.
+SESSION_PLAYERS = 32
+
+# Frames rendered per level of detail.
+ROTATION_FRAMES = 20
+
+
+def timed(fn, repeat, setup=None, operations=1):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    result = {'median_s': median, 'min_s': min(times), 'runs': repeat}
+    if operations > 1:
+        result['per_op_us'] = median / operations * 1e6
+    return result
+
+
+def wait_for(app, condition, timeout=600.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("benchmark step did not complete")
+        app.processEvents()
+
+
+def bench_database(results, size, badges, lookups, repeat):
+    # cold: badges drawn from the whole roster, cache emptied first.
+    # warm: the same number of lookups over a game night's worth of players.
+    rng = random.Random(size)
+    cold = [rng.choice(badges) for _ in range(lookups)]
+    players = rng.sample(badges, min(SESSION_PLAYERS, len(badges)))
+    warm = [rng.choice(players) for _ in range(lookups)]
+
+    def lookup_all(sample):
+        for badge_id in sample:
+            db.get_character_by_badge(badge_id)
+
+    results[f"db.get_character_by_badge.cold[{size}]"] = timed(
+        lambda: lookup_all(cold), repeat, setup=db.clear_badge_cache, operations=lookups)
+    lookup_all(warm)
+    results[f"db.get_character_by_badge.warm[{size}]"] = timed(
+        lambda: lookup_all(warm), repeat, operations=lookups)
+    results[f"db.get_all_characters[{size}]"] = timed(db.get_all_characters, repeat)
+    results[f"db.export_characters[{size}]"] = timed(
+        lambda: list(db.export_characters()), repeat)
+
+
+def bench_pipeline(results, size, badges, scans):
+    # Replay a synthetic session whose taps use badges from the roster, so
+    # every accepted scan goes through a real lookup.
+    events = scan_trace.generate_trace(readers=4, scans=scans, duration=scans / 20.0)
+    rng = random.Random(scans)
+    players = {}
+    events = [scan_trace.TraceEvent(event.t, event.reader_id,
+                                    players.setdefault(event.badge_id, rng.choice(badges)))
+              for event in events]
+    on_scan, finish = scan_trace._pipeline(db.DB_PATH)
+    start = time.perf_counter()
+    report = scan_trace.ReplayHarness(events, speed=0, via="pipeline", on_scan=on_scan).run()
+    elapsed = time.perf_counter() - start
+    finish()
+    results[f"pipeline.replay[{size}]"] = {
+        'median_s': elapsed, 'min_s': elapsed, 'runs': 1,
+        'per_op_us': elapsed / scans * 1e6,
+        'dropped': report['dropped'],
+        'latency_p99_ms': report['latency_ms']['p99'],
+    }
+
+
+def bench_admin_list(app, results, size, repeat):
+    from app.admin_window import AdminWindow
+    window = AdminWindow()
+    wait_for(app, lambda: window.character_list.count() == size)
+
+    def refresh():
+        window.refresh_character_list()
+        wait_for(app, lambda: window.character_list.count() == size)
+
+    results[f"ui.refresh_character_list[{size}]"] = timed(
+        refresh, repeat, setup=window.character_list.clear)
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+
+
+def bench_stl_readers(results, path, triangles, repeat):
+    # Parse and center only: the NumPy reader against vtkSTLReader.
+    from app.meshes import read_stl_numpy, read_stl_vtk
+    reference = timed(lambda: read_stl_vtk(path), repeat)
+    results[f"mesh.read_stl.vtk[{triangles}]"] = reference
+    result = timed(lambda: read_stl_numpy(path), repeat)
+    result['speedup'] = reference['median_s'] / result['median_s']
+    results[f"mesh.read_stl.numpy[{triangles}]"] = result
+
+
+def bench_meshes(app, results, meshes, directory, repeat):
+    from app.user_window import VTKWidget, VTK_AVAILABLE
+    from app.meshes import get_mesh_cache
+    from app.mesh_store import get_mesh_store
+    if not VTK_AVAILABLE:
+        print("vtk not installed: skipping load_stl", file=sys.stderr)
+        return
+    if QApplication.platformName() == 'offscreen':
+        # No OpenGL context: VTK logs every failed shader compile, and the
+        # timings cover parsing and pipeline set-up but not the GPU upload.
+        import vtk
+        vtk.vtkObject.GlobalWarningDisplayOff()
+    mesh_cache = get_mesh_cache()
+    mesh_store = get_mesh_store()
+    mesh_store.directory = os.path.join(directory, "3D_cache")
+    widget = VTKWidget()
+    widget.resize(500, 400)
+    widget.show()
+    app.processEvents()
+    for triangles in meshes:
+        path = synthetic.write_stl(os.path.join(directory, f"mesh_{triangles}.stl"), triangles)
+        bench_stl_readers(results, path, triangles, repeat)
+
+        def show():
+            # Until the model is on screen, background parsing included.
+            widget.load_stl(path)
+            wait_for(app, lambda: widget.loading_path is None)
+
+        def wait_for_save():
+            # The loader writes the store entry after the model is shown.
+            wait_for(app, lambda: not widget.loader._tasks)
+
+        def clear_all():
+            wait_for_save()
+            mesh_cache.clear()
+            mesh_store.clear()
+
+        # cold: parsed and decimated every time; store: first display after
+        # a restart, read back from the mesh store; cached: a repeat scan of
+        # the same miniature.
+        cold = timed(show, repeat, setup=clear_all)
+        results[f"vtk.load_stl.cold[{triangles}]"] = cold
+        wait_for_save()
+        store = timed(show, repeat, setup=mesh_cache.clear)
+        store['speedup'] = cold['median_s'] / store['median_s']
+        results[f"vtk.load_stl.store[{triangles}]"] = store
+        results[f"vtk.load_stl.cached[{triangles}]"] = timed(show, repeat)
+        # One rotation frame at each level of detail, full detail first.
+        widget.stop_rotation()
+        render_window = widget.vtk_widget.GetRenderWindow()
+        for level, mesh in enumerate(widget.levels):
+            widget.set_level(level)
+            render_window.Render()
+            results[f"vtk.frame[{triangles}].level{level}"] = dict(
+                timed(lambda: (widget.actor.RotateZ(0.5), render_window.Render()), ROTATION_FRAMES),
+                triangles=mesh.GetNumberOfCells())
+        widget.clear_scene()
+    widget.shutdown()
+    widget.deleteLater()
+    app.processEvents()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(profile):
+    try:
+        import vtk
+        vtk_version = vtk.vtkVersion.GetVTKVersion()
+    except ImportError:
+        vtk_version = None
+    return {
+        'profile': profile,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'sqlite': sqlite3.sqlite_version,
+        'numpy': np.__version__,
+        'vtk': vtk_version,
+        'qt_platform': QApplication.platformName(),
+    }
+
+
+def run(profile, only=None):
+    config = PROFILES[profile]
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    results = {}
+    groups = only or ('db', 'pipeline', 'ui', 'vtk')
+    with tempfile.TemporaryDirectory() as tmp:
+        if {'db', 'pipeline', 'ui'} & set(groups):
+            for size in config['rosters']:
+                path = os.path.join(tmp, f"roster_{size}.db")
+                start = time.perf_counter()
+                badges = synthetic.generate_roster(path, size)
+                elapsed = time.perf_counter() - start
+                results[f"db.import_characters[{size}]"] = {
+                    'median_s': elapsed, 'min_s': elapsed, 'runs': 1,
+                    'per_op_us': elapsed / size * 1e6}
+                if 'db' in groups:
+                    bench_database(results, size, badges, config['lookups'], config['repeat'])
+                if 'ui' in groups and size in config['ui_rosters']:
+                    bench_admin_list(app, results, size, config['repeat'])
+                if 'pipeline' in groups:
+                    bench_pipeline(results, size, badges, config['scans'])
+                shutdown_async_db()
+                db.close_all_connections()
+        if 'vtk' in groups:
+            bench_meshes(app, results, config['meshes'], tmp, config['repeat'])
+    return {'environment': environment(profile), 'results': results}
+
+
+def compare(current, baseline, tolerance):
+    regressions = []
+    rows = []
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            rows.append((name, None, result['median_s'], None))
+            continue
+        ratio = result['median_s'] / reference['median_s'] if reference['median_s'] else 1.0
+        rows.append((name, reference['median_s'], result['median_s'], ratio))
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    width = max((len(row[0]) for row in rows), default=10)
+    print(f"{'case':<{width}} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, reference, median, ratio in rows:
+        before = f"{reference * 1000:10.2f}ms" if reference is not None else f"{'-':>12}"
+        change = f"{(ratio - 1) * 100:+7.1f}%" if ratio is not None else f"{'new':>8}"
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<{width}} {before} {median * 1000:10.2f}ms {change}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--only', nargs='+', choices=('db', 'pipeline', 'ui', 'vtk'))
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against this results file")
+    parser.add_argument('--save-baseline', metavar='PATH', help="store the results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown before a case counts as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    current = run(args.profile, args.only)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['environment'].get('profile') != args.profile:
+            print(f"warning: baseline profile is {baseline['environment'].get('profile')!r}",
+                  file=sys.stderr)
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.tolerance:.0%}", file=sys.stderr)
+            return 1
+    else:
+        for name, result in current['results'].items():
+            speedup = f"  x{result['speedup']:.1f}" if 'speedup' in result else ""
+            print(f"{name:<48} {result['median_s'] * 1000:10.2f} ms{speedup}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# Deterministic synthetic data for the benchmarks: rosters of any size
+# loaded through the normal import path, and closed STL meshes of an exact
+# triangle count (a bumpy torus, so decimation and normals have real work
+# to do). The same seed always gives the same badges, stats and geometry.
+#
+#   python benchmarks/synthetic.py roster bench.db --characters 100000
+#   python benchmarks/synthetic.py stl 3D/bench_1m.stl --triangles 1000000
+#   python benchmarks/synthetic.py stl 3D/bench_ascii.stl --triangles 20000 --ascii
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import database as db
+from app.badge_key import format_uid
+from app.stl_reader import STL_HEADER_SIZE, STL_RECORD
+
+# Minimum segments around either circle of the torus. Above that the grid
+# is sized from the triangle count, with quads of roughly square shape.
+MIN_RING = 16
+
+
+def roster_records(count, seed=0, with_models=None):
+    # Half 4-byte and half 7-byte UIDs (MIFARE Classic and Ultralight/NTAG).
+    rng = random.Random(seed)
+    situations = db.SITUATIONS
+    low, high = db.STAT_RANGE
+    for i in range(count):
+        # Multiplying by an odd constant is a bijection modulo 2^bits, so
+        # UIDs are scattered but never collide.
+        size = 4 if i % 2 else 7
+        bits = 8 * size
+        value = ((i * 0x9E3779B97F4A7C15) ^ (seed * 0x5851F42D)) % (1 << bits)
+        uid = value.to_bytes(size, 'big')
+        record = {
+            'badge_id': format_uid(uid),
+            'nom_perso': f"Perso {i:07d}",
+            'file_path': with_models[i % len(with_models)] if with_models else "",
+            'credits': rng.randint(0, 10000),
+            'situation': situations[i % len(situations)],
+        }
+        for field in db.STAT_FIELDS:
+            record[field] = rng.randint(low, high)
+        yield record
+
+
+def generate_roster(path, count, seed=0, with_models=None):
+    # Fresh database at path, filled through import_characters like a real
+    # roster import. Returns the list of badge IDs, in insertion order.
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.close_all_connections()
+    db.DB_PATH = path
+    db.init_database()
+    records = list(roster_records(count, seed, with_models))
+    db.import_characters(records).result()
+    return [record['badge_id'] for record in records]
+
+
+def torus_mesh(triangles, seed=0):
+    # Returns (points, faces): float32 (n, 3) vertices and int64 (triangles, 3)
+    # indices of a closed, bumpy torus with exactly the requested triangles.
+    ring = max(MIN_RING, int(math.sqrt(triangles / 8)))
+    tube = max(MIN_RING, math.ceil(triangles / (2 * ring)))
+    rng = np.random.default_rng(seed)
+    phases = rng.uniform(0, 2 * np.pi, 4)
+
+    u = np.linspace(0, 2 * np.pi, tube, endpoint=False)
+    v = np.linspace(0, 2 * np.pi, ring, endpoint=False)
+    uu, vv = np.meshgrid(u, v, indexing='ij')
+    bumps = 0.04 * np.sin(7 * uu + phases[0]) * np.cos(5 * vv + phases[1])
+    bumps += 0.02 * np.sin(23 * uu + phases[2]) * np.sin(11 * vv + phases[3])
+    radius = 0.35 + bumps
+    x = (1.0 + radius * np.cos(vv)) * np.cos(uu)
+    y = (1.0 + radius * np.cos(vv)) * np.sin(uu)
+    z = radius * np.sin(vv) + 0.5
+    points = np.stack((x, y, z), axis=-1).reshape(-1, 3).astype(np.float32)
+
+    i = np.arange(tube)[:, None]
+    j = np.arange(ring)[None, :]
+    a = i * ring + j
+    b = ((i + 1) % tube) * ring + j
+    c = ((i + 1) % tube) * ring + (j + 1) % ring
+    d = i * ring + (j + 1) % ring
+    faces = np.stack((np.stack((a, b, c), -1), np.stack((a, c, d), -1)), axis=2)
+    faces = faces.reshape(-1, 3)[:triangles]
+    return points, faces
+
+
+def face_normals(points, faces):
+    corners = points[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    return normals
+
+
+def write_stl(path, triangles, seed=0, ascii=False):
+    points, faces = torus_mesh(triangles, seed)
+    corners = points[faces]
+    normals = face_normals(points, faces)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if ascii:
+        with open(path, 'w', encoding='ascii') as f:
+            f.write("solid synthetic\n")
+            for normal, (p0, p1, p2) in zip(normals, corners):
+                f.write(f"facet normal {normal[0]:e} {normal[1]:e} {normal[2]:e}\n"
+                        " outer loop\n"
+                        f"  vertex {p0[0]:e} {p0[1]:e} {p0[2]:e}\n"
+                        f"  vertex {p1[0]:e} {p1[1]:e} {p1[2]:e}\n"
+                        f"  vertex {p2[0]:e} {p2[1]:e} {p2[2]:e}\n"
+                        " endloop\nendfacet\n")
+            f.write("endsolid synthetic\n")
+        return path
+    records = np.zeros(len(faces), dtype=STL_RECORD)
+    records['normal'] = normals
+    records['vertices'] = corners
+    with open(path, 'wb') as f:
+        f.write(b"synthetic mesh".ljust(STL_HEADER_SIZE - 4, b" "))
+        f.write(np.uint32(len(records)).tobytes())
+        records.tofile(f)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic rosters and STL meshes for benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    roster = commands.add_parser("roster")
+    roster.add_argument("path")
+    roster.add_argument("--characters", type=int, default=10000)
+    roster.add_argument("--seed", type=int, default=0)
+    stl = commands.add_parser("stl")
+    stl.add_argument("path")
+    stl.add_argument("--triangles", type=int, default=100000)
+    stl.add_argument("--seed", type=int, default=0)
+    stl.add_argument("--ascii", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "roster":
+        generate_roster(args.path, args.characters, args.seed)
+        db.close_all_connections()
+        print(f"{args.characters} characters in {args.path} "
+              f"({time.perf_counter() - start:.1f} s)")
+    else:
+        write_stl(args.path, args.triangles, args.seed, args.ascii)
+        print(f"{args.triangles} triangles in {args.path} "
+              f"({os.path.getsize(args.path) / 1e6:.1f} MB, {time.perf_counter() - start:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
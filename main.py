@@ -1,60 +1,58 @@
 import sys
+import time
+import argparse
+import logging
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QPushButton, QLineEdit, QFrame, QComboBox, QCheckBox
+    QLabel, QPushButton, QLineEdit, QFrame, QComboBox, QCheckBox, QListWidget
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
+from PyQt5.QtCore import Qt, QTimer, QEvent
 from PyQt5.QtGui import QFont
 from app import database as db
 from app.admin_window import AdminWindow
 from app.user_window import UserWindow
+from app.scan_log import ScanLogger
+from app.async_db import shutdown_async_db
+from app.reader_hub import ReaderHub, SIMULATION_READER
+from app.scan_filter import ScanFilter, PASS_THROUGH
+from app.serial_reader import BAUDRATES, DEFAULT_BAUDRATE
 
-try:
-    import serial
-    import serial.tools.list_ports
-    SERIAL_AVAILABLE = True
-except ImportError:
-    SERIAL_AVAILABLE = False
+from app.port_watcher import PortWatcher, SERIAL_AVAILABLE
+from app.scan_trace import ScanRecorder
+from app.latency import get_latency_tracker
+from app.diagnostics_window import DiagnosticsWindow
+from app import tracing
+from app.tracing import traced
 
+# Qt events shorter than this are not traced, or the paint and timer
+# events would flush everything else out of the ring buffer.
+QT_EVENT_THRESHOLD = 0.001
 
-class ArduinoReaderThread(QThread):
-    badge_scanned = pyqtSignal(str)
-    connection_status = pyqtSignal(bool, str)
-    
-    def __init__(self, port, baudrate=9600):
-        super().__init__()
-        self.port = port
-        self.baudrate = baudrate
-        self.running = False
-        self.serial_connection = None
-        
-    def run(self):
-        self.running = True
+QT_EVENT_NAMES = {value: name for name, value in vars(QEvent).items()
+                  if isinstance(value, QEvent.Type)}
+
+
+class TracedApplication(QApplication):
+    # Used instead of QApplication when tracing is on: every event that
+    # keeps the GUI thread busy for QT_EVENT_THRESHOLD or more becomes a
+    # span, so a stall shows what the event loop was dispatching.
+    def notify(self, receiver, event):
+        recorder = tracing.recorder()
+        if recorder is None:
+            return super().notify(receiver, event)
+        event_type = event.type()
+        start = time.perf_counter_ns()
         try:
-            self.serial_connection = serial.Serial(self.port, self.baudrate, timeout=1)
-            self.connection_status.emit(True, f"Connecté à {self.port}")
-            
-            while self.running:
-                if self.serial_connection.in_waiting > 0:
-                    line = self.serial_connection.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        self.badge_scanned.emit(line)
-                        
-        except Exception as e:
-            self.connection_status.emit(False, f"Erreur: {str(e)}")
+            return super().notify(receiver, event)
         finally:
-            if self.serial_connection and self.serial_connection.is_open:
-                self.serial_connection.close()
-                
-    def stop(self):
-        self.running = False
-        if self.serial_connection and self.serial_connection.is_open:
-            self.serial_connection.close()
-        self.wait()
+            end = time.perf_counter_ns()
+            if end - start >= QT_EVENT_THRESHOLD * 1e9:
+                recorder.complete(QT_EVENT_NAMES.get(event_type, f"QEvent {int(event_type)}"),
+                                  "qt", start, end, {'receiver': type(receiver).__name__})
 
 
 class MainApplication(QMainWindow):
-    def __init__(self):
+    def __init__(self, record_scans=None, latency_report=None):
         super().__init__()
         
         self.setWindowTitle("JDR Badge Manager")
@@ -98,19 +96,49 @@ class MainApplication(QMainWindow):
             QComboBox::drop-down { border: none; }
             QComboBox::down-arrow { image: none; }
             QFrame { background-color: #252525; border-radius: 10px; }
+            QListWidget {
+                background-color: #2a2a2a;
+                border: 1px solid #444;
+                border-radius: 5px;
+                font-size: 11px;
+            }
             QCheckBox { color: #888888; }
             QCheckBox::indicator { width: 18px; height: 18px; }
         """)
         
         db.init_database()
         
+        self.scan_logger = ScanLogger()
+        self.scan_logger.start()
+        self.scan_recorder = ScanRecorder(record_scans) if record_scans else None
+        self.latency = get_latency_tracker()
+        self.latency_report = latency_report
+        
         self.admin_window = None
         self.user_window = None
-        self.arduino_thread = None
-        self.is_connected = False
+        self.diagnostics_window = None
+        
+        self.reader_hub = ReaderHub(self)
+        self.reader_hub.scan_received.connect(self.on_badge_scanned)
+        self.reader_hub.reader_status.connect(self.on_reader_status)
+        
+        # Typed simulation scans are deliberate, so they skip deduplication.
+        self.scan_filter = ScanFilter(parent=self)
+        self.scan_filter.configure(SIMULATION_READER, PASS_THROUGH)
+        self.scan_filter.scan_accepted.connect(self.on_scan_accepted)
+        
+        self.port_watcher = PortWatcher()
+        self.port_watcher.ports_changed.connect(self.on_ports_changed)
         
         self.setup_ui()
         
+        self.reader_stats_timer = QTimer(self)
+        self.reader_stats_timer.timeout.connect(self.refresh_reader_list)
+        self.reader_stats_timer.start(2000)
+        
+        if SERIAL_AVAILABLE:
+            self.port_watcher.start()
+        
     def setup_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -147,7 +175,7 @@ class MainApplication(QMainWindow):
         arduino_layout.setContentsMargins(15, 15, 15, 15)
         arduino_layout.setSpacing(10)
         
-        arduino_title = QLabel("Lecteur RFID Arduino")
+        arduino_title = QLabel("Lecteurs RFID Arduino")
         arduino_title.setFont(QFont("Arial", 12, QFont.Bold))
         arduino_title.setStyleSheet("color: #ffffff;")
         arduino_layout.addWidget(arduino_title)
@@ -160,9 +188,15 @@ class MainApplication(QMainWindow):
         
         self.port_combo = QComboBox()
         self.port_combo.setMinimumWidth(150)
-        self.refresh_ports()
+        self.port_combo.currentIndexChanged.connect(self.update_connect_button)
         port_layout.addWidget(self.port_combo)
         
+        self.baud_combo = QComboBox()
+        for baudrate in BAUDRATES:
+            self.baud_combo.addItem(str(baudrate), baudrate)
+        self.baud_combo.setCurrentText(str(DEFAULT_BAUDRATE))
+        port_layout.addWidget(self.baud_combo)
+        
         refresh_btn = QPushButton("↻")
         refresh_btn.setFixedWidth(40)
         refresh_btn.setStyleSheet("padding: 8px;")
@@ -172,19 +206,22 @@ class MainApplication(QMainWindow):
         self.connect_btn = QPushButton("Connecter")
         self.connect_btn.setObjectName("connect")
         self.connect_btn.clicked.connect(self.toggle_arduino_connection)
-        if not SERIAL_AVAILABLE:
-            self.connect_btn.setEnabled(False)
-            self.connect_btn.setText("pyserial manquant")
         port_layout.addWidget(self.connect_btn)
         
         arduino_layout.addLayout(port_layout)
         
+        self.reader_list = QListWidget()
+        self.reader_list.setMaximumHeight(80)
+        arduino_layout.addWidget(self.reader_list)
+        
         self.status_label = QLabel("Non connecté")
         self.status_label.setStyleSheet("color: #888888; font-size: 11px;")
         arduino_layout.addWidget(self.status_label)
         
         main_layout.addWidget(arduino_frame)
         
+        self.refresh_ports()
+        
         main_layout.addSpacing(5)
         
         sim_frame = QFrame()
@@ -213,62 +250,111 @@ class MainApplication(QMainWindow):
         
         main_layout.addWidget(sim_frame)
         
+        diagnostics_btn = QPushButton("Diagnostics de latence")
+        diagnostics_btn.setStyleSheet("background-color: #374151; padding: 8px;")
+        diagnostics_btn.clicked.connect(self.open_diagnostics)
+        main_layout.addWidget(diagnostics_btn)
+        
         main_layout.addStretch()
         
     def refresh_ports(self):
-        self.port_combo.clear()
+        # Enumeration runs on the port watcher thread; the list arrives
+        # through on_ports_changed.
         if SERIAL_AVAILABLE:
-            ports = serial.tools.list_ports.comports()
-            for port in ports:
-                self.port_combo.addItem(f"{port.device} - {port.description}", port.device)
-            if not ports:
-                self.port_combo.addItem("Aucun port détecté", None)
+            if self.port_combo.count() == 0:
+                self.port_combo.addItem("Recherche des ports...", None)
+            self.port_watcher.scan_now()
         else:
+            self.port_combo.clear()
             self.port_combo.addItem("pyserial non installé", None)
+        self.update_connect_button()
+        
+    @traced("ui")
+    def on_ports_changed(self, ports):
+        self.reader_hub.set_ports(ports)
+        selected = self.port_combo.currentData()
+        self.port_combo.blockSignals(True)
+        self.port_combo.clear()
+        for port in ports:
+            self.port_combo.addItem(f"{port.device} - {port.description}", port.device)
+        if not ports:
+            self.port_combo.addItem("Aucun port détecté", None)
+        index = self.port_combo.findData(selected)
+        if index >= 0:
+            self.port_combo.setCurrentIndex(index)
+        self.port_combo.blockSignals(False)
+        self.update_connect_button()
             
-    def toggle_arduino_connection(self):
-        if self.is_connected:
-            self.disconnect_arduino()
+    def update_connect_button(self):
+        if not SERIAL_AVAILABLE:
+            self.connect_btn.setEnabled(False)
+            self.connect_btn.setText("pyserial manquant")
+            return
+        reader_id = self.reader_hub.reader_for_port(self.port_combo.currentData())
+        if reader_id is not None:
+            # Also while reconnecting, so the retries can be cancelled.
+            self.connect_btn.setText("Déconnecter")
+            connected = self.reader_hub.is_connected(reader_id)
+            self.connect_btn.setObjectName("connected" if connected else "connect")
         else:
-            self.connect_arduino()
+            self.connect_btn.setText("Connecter")
+            self.connect_btn.setObjectName("connect")
+        self.connect_btn.setStyle(self.connect_btn.style())
             
-    def connect_arduino(self):
+    def toggle_arduino_connection(self):
         port = self.port_combo.currentData()
         if not port:
             self.status_label.setText("Veuillez sélectionner un port valide")
             return
-            
-        self.arduino_thread = ArduinoReaderThread(port)
-        self.arduino_thread.badge_scanned.connect(self.on_badge_scanned)
-        self.arduino_thread.connection_status.connect(self.on_connection_status)
-        self.arduino_thread.start()
-        
-    def disconnect_arduino(self):
-        if self.arduino_thread:
-            self.arduino_thread.stop()
-            self.arduino_thread = None
-        self.is_connected = False
-        self.connect_btn.setText("Connecter")
-        self.connect_btn.setObjectName("connect")
-        self.connect_btn.setStyle(self.connect_btn.style())
-        self.status_label.setText("Déconnecté")
-        self.port_combo.setEnabled(True)
-        
-    def on_connection_status(self, connected, message):
-        self.is_connected = connected
-        self.status_label.setText(message)
-        if connected:
-            self.connect_btn.setText("Déconnecter")
-            self.connect_btn.setObjectName("connected")
-            self.port_combo.setEnabled(False)
+        reader_id = self.reader_hub.reader_for_port(port)
+        if reader_id is not None:
+            self.reader_hub.disconnect_reader(reader_id)
         else:
-            self.connect_btn.setText("Connecter")
-            self.connect_btn.setObjectName("connect")
-            self.port_combo.setEnabled(True)
-        self.connect_btn.setStyle(self.connect_btn.style())
-        
-    def on_badge_scanned(self, badge_id):
-        self.on_badge_selected(badge_id)
+            self.reader_hub.connect_reader(port, baudrate=self.baud_combo.currentData())
+            self.status_label.setText(f"Connexion à {port}...")
+        
+    @traced("ui")
+    def on_reader_status(self, reader_id, connected, message):
+        self.status_label.setText(f"{reader_id}: {message}")
+        self.update_connect_button()
+        self.refresh_reader_list()
+        
+    @traced("ui")
+    def refresh_reader_list(self):
+        self.reader_list.clear()
+        filter_stats = self.scan_filter.stats()['readers']
+        for reader_id, stats in self.reader_hub.stats().items():
+            if stats['port'] is None:
+                state = "simulation"
+            elif stats['connected']:
+                state = f"connecté, {stats['protocol']}"
+                if stats['bad_frames']:
+                    state += f", {stats['bad_frames']} trames invalides"
+                if stats['reconnects']:
+                    state += (f", {stats['reconnects']} reconnexions "
+                              f"(dernière {stats['last_reconnect_latency']:.1f} s)")
+            elif stats['reconnecting']:
+                state = "reconnexion..."
+            else:
+                state = "déconnecté"
+            self.reader_list.addItem(
+                f"{reader_id} — {state} — {stats['scans']} scans "
+                f"({stats['scans_per_minute']:.1f}/min), "
+                f"{filter_stats.get(reader_id, {}).get('refreshes_avoided', 0)} ignorés")
+        
+    @traced("ui")
+    def on_badge_scanned(self, scan):
+        # Every read is logged; only the deduplicated ones reach the display.
+        self.latency.delivered(scan)
+        self.scan_logger.log(scan.badge_id, scan.reader_id, scan.received_at)
+        if self.scan_recorder:
+            self.scan_recorder.record(scan)
+        self.scan_filter.offer(scan)
+        
+    @traced("ui")
+    def on_scan_accepted(self, scan):
+        self.latency.begin(scan)
+        self.on_badge_selected(scan.badge_id)
         
     def open_admin(self):
         if self.admin_window is None or not self.admin_window.isVisible():
@@ -287,6 +373,14 @@ class MainApplication(QMainWindow):
             self.user_window.raise_()
             self.user_window.activateWindow()
             
+    def open_diagnostics(self):
+        if self.diagnostics_window is None:
+            self.diagnostics_window = DiagnosticsWindow(self)
+        self.diagnostics_window.show()
+        self.diagnostics_window.raise_()
+        self.diagnostics_window.activateWindow()
+            
+    @traced("ui")
     def on_badge_selected(self, badge_id):
         self.open_user()
         if self.user_window:
@@ -297,15 +391,44 @@ class MainApplication(QMainWindow):
     def simulate_badge_scan(self):
         badge_id = self.badge_entry.text().strip()
         if badge_id:
-            self.on_badge_selected(badge_id)
+            self.reader_hub.inject(badge_id)
             
     def closeEvent(self, event):
-        if self.arduino_thread:
-            self.arduino_thread.stop()
+        self.reader_stats_timer.stop()
+        self.port_watcher.stop()
+        self.reader_hub.disconnect_all()
+        self.scan_logger.stop()
+        if self.scan_recorder:
+            self.scan_recorder.close()
+        if self.latency_report:
+            self.latency.export_json(self.latency_report)
+        if self.user_window:
+            # Stops the mesh loader before its threads outlive the widgets.
+            self.user_window.close()
+        shutdown_async_db()
+        db.close_all_connections()
         super().closeEvent(event)
             
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="JDR Badge Manager")
+    parser.add_argument("--record-scans", metavar="TRACE",
+                        help="enregistrer les scans de la session (rejouables avec app.scan_trace)")
+    parser.add_argument("--latency-report", metavar="JSON",
+                        help="écrire les latences scan → affichage en quittant")
+    parser.add_argument("--trace", metavar="JSON",
+                        help="tracer l'application et écrire la chronologie (format Chrome Trace) "
+                             f"en quittant ; équivaut à {tracing.ENV_VAR}=JSON")
+    # Qt consumes its own options (-style, -platform...) from the rest.
+    args, qt_args = parser.parse_known_args()
+    
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.trace:
+        tracing.enable(args.trace)
+    else:
+        tracing.enable_from_env()
+    application_class = TracedApplication if tracing.enabled() else QApplication
+    app = application_class(sys.argv[:1] + qt_args)
     app.setStyle('Fusion')
     
     palette = app.palette()
@@ -313,9 +436,13 @@ def main():
     palette.setColor(palette.WindowText, Qt.white)
     app.setPalette(palette)
     
-    window = MainApplication()
+    window = MainApplication(record_scans=args.record_scans,
+                             latency_report=args.latency_report)
     window.show()
-    sys.exit(app.exec_())
+    code = app.exec_()
+    if tracing.enabled():
+        logging.getLogger(__name__).info("Trace écrite dans %s", tracing.dump())
+    sys.exit(code)
 
 if __name__ == "__main__":
     main()